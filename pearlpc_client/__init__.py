@@ -0,0 +1,22 @@
+"""
+Asyncio client library for the PEARL pressure controller's serial-over-TCP protocol.
+"""
+
+from pearlpc_client.client import PearlPCClient, PearlPCPool
+from pearlpc_client.protocol import (
+    Identity,
+    Limits,
+    PearlPCError,
+    ReplyTimeout,
+    StatusReport,
+)
+
+__all__ = [
+    "Identity",
+    "Limits",
+    "PearlPCClient",
+    "PearlPCError",
+    "PearlPCPool",
+    "ReplyTimeout",
+    "StatusReport",
+]
@@ -0,0 +1,337 @@
+import asyncio
+import collections
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Self, TypeVar
+
+from pearlpc_client.protocol import (
+    IN_TERMINATOR,
+    REPLY_TIMEOUT,
+    SETTLE_TIME,
+    Identity,
+    Limits,
+    PearlPCError,
+    ReplyTimeout,
+    StatusReport,
+    find_reply,
+    format_value,
+    is_query,
+    parse_identity,
+    parse_limits,
+    parse_memory,
+    parse_status,
+)
+
+T = TypeVar("T")
+
+# Memory addresses read by the IOC
+CELL_PRESSURE_ADDRESS = 87
+PUMP_PRESSURE_ADDRESS = 88
+
+
+class PearlPCClient:
+    """
+    Asyncio client for one PEARL pressure controller, e.g. one terminal server port.
+
+    Requests may be issued concurrently: each query is written as soon as it is made and
+    replies are matched to queries in order, so several reads are pipelined on the
+    connection. Setters and actions are not replied to, as PearlPC.proto reads no reply to
+    them: each is written once the queries before it are answered, the next request is held
+    back by the settle time, as PearlPC.proto does with its 100 ms waits, and anything the
+    controller sends meanwhile is discarded. If a reply times out the connection is closed,
+    as its framing can no longer be trusted, and the next request reconnects.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        reply_timeout: float = REPLY_TIMEOUT,
+        settle_time: float = SETTLE_TIME,
+    ) -> None:
+        """
+        @param host: (str) host of the controller or its terminal server
+        @param port: (int) TCP port of the controller
+        @param reply_timeout: (float) seconds to wait for each reply
+        @param settle_time: (float) seconds to wait after a setter or action
+        """
+        self.host = host
+        self.port = port
+        self.reply_timeout = reply_timeout
+        self.settle_time = settle_time
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = collections.deque()
+        self._send_lock = asyncio.Lock()
+        self._ready_at = 0.0
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.host, self.port
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    async def connect(self) -> None:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.reply_timeout
+            )
+            self._receiver = asyncio.ensure_future(self._receive(self._reader))
+
+    async def close(self) -> None:
+        self._disconnect(ConnectionError("Client closed"))
+        if self._receiver is not None:
+            await asyncio.gather(self._receiver, return_exceptions=True)
+            self._receiver = None
+
+    async def __aenter__(self) -> Self:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def request(self, request: str) -> str | None:
+        """
+        Send a request and wait for its reply.
+        @param request: (str) request without terminator, e.g. "vr0087"
+        @return: (str) reply including terminators, or None for a setter or action, which
+        is sent without waiting for a reply
+        """
+        if not is_query(request):
+            await self._command(request)
+            return None
+        loop = asyncio.get_running_loop()
+        async with self._send_lock:
+            await self._ready_to_send()
+            reply = loop.create_future()
+            self._pending.append((request, reply))
+            self._writer.write((request + IN_TERMINATOR).encode())
+        try:
+            return await asyncio.wait_for(reply, self.reply_timeout)
+        except TimeoutError:
+            error = ReplyTimeout(f"No reply to {request!r} from {self.host}:{self.port}")
+            self._disconnect(error)
+            raise error from None
+
+    async def _command(self, request: str) -> None:
+        """
+        Send a setter or action. The controller replies to these with at most a line that
+        PearlPC.proto ignores, and not at all if it rejects the value.
+        @param request: (str) request without terminator, e.g. "sp0100"
+        """
+        loop = asyncio.get_running_loop()
+        async with self._send_lock:
+            await self._ready_to_send()
+            if self._pending:
+                # anything the controller sends from now on is not a reply to these
+                await asyncio.wait([reply for _, reply in self._pending])
+                await self._ready_to_send()
+            self._writer.write((request + IN_TERMINATOR).encode())
+            self._ready_at = loop.time() + self.settle_time
+
+    async def _ready_to_send(self) -> None:
+        """
+        Connect if needed and wait out the settle time of the last setter or action.
+        Called holding the send lock.
+        """
+        await self.connect()
+        delay = self._ready_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._writer is None:
+            # the connection was lost while settling
+            await self.connect()
+
+    async def _receive(self, reader: asyncio.StreamReader) -> None:
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    raise ConnectionError(f"Connection closed by {self.host}:{self.port}")
+                if not self._pending:
+                    # sent after a setter or action, which PearlPC.proto discards
+                    continue
+                buffer += data
+                while self._pending:
+                    start, end = find_reply(buffer, self._pending[0][0])
+                    if end < 0:
+                        break
+                    _, reply = self._pending.popleft()
+                    if not reply.done():
+                        reply.set_result(buffer[start:end].decode(errors="replace"))
+                    buffer = buffer[end:]
+                if not self._pending:
+                    buffer = b""
+        except OSError as error:
+            self._disconnect(error)
+
+    def _disconnect(self, error: Exception) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+        if self._receiver is not None and self._receiver is not asyncio.current_task():
+            self._receiver.cancel()
+        while self._pending:
+            _, reply = self._pending.popleft()
+            if not reply.done():
+                reply.set_exception(error)
+
+    async def status(self) -> StatusReport:
+        return parse_status(await self.request("st"))
+
+    async def limits(self) -> Limits:
+        return parse_limits(await self.request("ls"))
+
+    async def identity(self) -> Identity:
+        return parse_identity(await self.request("id"))
+
+    async def read_memory(self, address: int) -> int:
+        """
+        @param address: (int) controller memory address, 0 to 1023
+        @return: (int) value at the address
+        """
+        return parse_memory(await self.request(format_value("vr", address)), address)
+
+    async def cell_pressure(self) -> int:
+        return await self.read_memory(CELL_PRESSURE_ADDRESS)
+
+    async def pump_pressure(self) -> int:
+        return await self.read_memory(PUMP_PRESSURE_ADDRESS)
+
+    async def set_rate(self, rate: int) -> None:
+        await self._command(format_value("ra", rate))
+
+    async def set_min_pressure(self, pressure: int) -> None:
+        await self._command(format_value("mn", pressure))
+
+    async def set_max_pressure(self, pressure: int) -> None:
+        await self._command(format_value("mx", pressure))
+
+    async def set_setpoint(self, pressure: int) -> None:
+        await self._command(format_value("sp", pressure))
+
+    async def set_seal_fail(self, pressure: int) -> None:
+        await self._command(format_value("sf", pressure))
+
+    async def set_closed_loop(self, closed: bool) -> None:
+        await self._command(format_value("sloop", int(closed), 1))
+
+    async def set_user_stop_limit(self, pressure: int) -> None:
+        await self._command(format_value("ul", pressure))
+
+    async def set_difference_threshold(self, pressure: int) -> None:
+        await self._command(format_value("th", pressure))
+
+    async def set_ids(self, initial_id: int, secondary_id: int) -> None:
+        await self._command(format_value("si", initial_id))
+        await self._command(format_value("sd", secondary_id))
+
+    async def send_parameters(
+        self, rate: int, max_pressure: int, min_pressure: int, setpoint: int, closed_loop: bool
+    ) -> None:
+        """
+        Send the servo parameters in the order the SEND_PARAMETERS record sends them.
+        """
+        await self.set_rate(rate)
+        await self.set_max_pressure(max_pressure)
+        await self.set_min_pressure(min_pressure)
+        await self.set_setpoint(setpoint)
+        await self.set_closed_loop(closed_loop)
+
+    async def run(self) -> None:
+        await self._command("run")
+
+    async def stop(self) -> None:
+        await self._command("stop")
+
+    async def reset(self) -> None:
+        await self._command("reset")
+
+    async def purge(self) -> None:
+        await self._command("pu")
+
+    async def reset_error(self) -> None:
+        await self._command("er")
+
+    async def wait_until_idle(self, timeout: float, poll_interval: float = 1.0) -> StatusReport:
+        """
+        Poll the status until the controller is neither running nor busy.
+        @param timeout: (float) seconds to wait
+        @param poll_interval: (float) seconds between status requests
+        @return: (StatusReport) the first idle status
+        """
+
+        async def poll() -> StatusReport:
+            while True:
+                status = await self.status()
+                if not status.run and not status.busy:
+                    return status
+                await asyncio.sleep(poll_interval)
+
+        return await asyncio.wait_for(poll(), timeout)
+
+
+class PearlPCPool:
+    """
+    Connections to several controllers, for example on the ports of a terminal server,
+    opened on first use and reused for every later request to the same address.
+    """
+
+    def __init__(self, addresses: Iterable[tuple[str, int]] = (), **client_options: float) -> None:
+        """
+        @param addresses: (iterable) host and port of each controller
+        @param client_options: options passed to each PearlPCClient
+        """
+        self._client_options = client_options
+        self._clients = {}
+        for address in addresses:
+            self.add(*address)
+
+    def add(self, host: str, port: int) -> PearlPCClient:
+        address = (host, port)
+        if address not in self._clients:
+            self._clients[address] = PearlPCClient(host, port, **self._client_options)
+        return self._clients[address]
+
+    @property
+    def addresses(self) -> list[tuple[str, int]]:
+        return list(self._clients)
+
+    def client(self, host: str, port: int) -> PearlPCClient:
+        """
+        @return: (PearlPCClient) the pooled client for the address, created if needed
+        """
+        return self.add(host, port)
+
+    async def gather(
+        self, operation: Callable[[PearlPCClient], Awaitable[T]]
+    ) -> dict[tuple[str, int], T | Exception]:
+        """
+        Run an operation on every controller concurrently.
+        @param operation: (callable) coroutine function taking a client
+        @return: (dict) result, or the error raised, keyed by address
+        """
+        clients = list(self._clients.values())
+        results = await asyncio.gather(
+            *(operation(client) for client in clients), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(
+                result, (PearlPCError, ConnectionError, OSError)
+            ):
+                raise result
+        return {client.address: result for client, result in zip(clients, results)}
+
+    async def close(self) -> None:
+        await asyncio.gather(*(client.close() for client in self._clients.values()))
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
@@ -0,0 +1,229 @@
+"""
+Requests, reply framing and reply parsing for the PEARL pressure controller, as used by
+PearlPC.proto and implemented by the Lewis emulator.
+"""
+
+import re
+from dataclasses import dataclass
+
+IN_TERMINATOR = "\r"
+OUT_TERMINATOR = b"\r\n"
+
+# ReplyTimeout in PearlPC.proto, in seconds
+REPLY_TIMEOUT = 2.0
+# PearlPC.proto waits 100 ms after every setter and action before the next command
+SETTLE_TIME = 0.1
+
+# Number of out terminators ending each multi-line reply, keyed by request, as the emulator
+# sends them. id replies are wrapped in CR LF ... CR LF LF and then terminated as usual.
+# Every other request is answered with a single terminated line.
+REPLY_TERMINATOR_COUNTS = {
+    "st": 4,
+    "ls": 3,
+    "id": 3,
+}
+
+# get_id in PearlPC.proto reads the id reply up to CR LF LF, whether or not a CR LF follows
+ID_TERMINATOR = b"\r\n\n"
+
+# Requests that only read, so are replied to and need no settle time after them
+QUERIES = ("st", "ls", "id", "vr", "dt")
+
+# Smallest and largest value each command takes, as the controller accepts them. It does not
+# reply to a setter with a value out of range, so values are checked before sending.
+VALUE_RANGES = {
+    "ra": (0, 40),
+    "mn": (1, 9999),
+    "mx": (1, 9999),
+    "sp": (1, 1000),
+    "sf": (1, 999),
+    "si": (0, 9999),
+    "sd": (0, 9999),
+    "sloop": (0, 1),
+    "ul": (0, 9999),
+    "th": (1, 999),
+    "vr": (0, 1023),
+}
+
+IDENTITY_PATTERN = re.compile(
+    r"([0-9]{4}) ([0-9]{4}) ISIS PEARL INTENSIFIER CONTROLLER V([0-9.]+) (Not Set|Oil|Pentane)"
+)
+MEMORY_PATTERN = re.compile(r"vr([0-9]{4}) (-?[0-9.]+)")
+
+
+class PearlPCError(Exception):
+    """
+    Raised when the controller's reply cannot be used.
+    """
+
+
+class ReplyTimeout(PearlPCError):
+    """
+    Raised when the controller does not reply within the reply timeout.
+    """
+
+
+def expected_terminators(request: str) -> int:
+    """
+    @param request: (str) request without terminator
+    @return: (int) number of out terminators that complete the emulator's reply to the request
+    """
+    return REPLY_TERMINATOR_COUNTS.get(request, 1)
+
+
+def is_query(request: str) -> bool:
+    # compare whole commands, as stop starts like st
+    return request.rstrip("0123456789") in QUERIES
+
+
+def reply_end(buffer: bytes, expected: int) -> int:
+    """
+    Frame a reply exactly as the emulator sends it, for comparing replies byte for byte.
+    @param buffer: (bytes) received data
+    @param expected: (int) number of out terminators ending the reply
+    @return: (int) length of the complete reply at the start of buffer, or -1 if incomplete
+    """
+    position = 0
+    for _ in range(expected):
+        found = buffer.find(OUT_TERMINATOR, position)
+        if found < 0:
+            return -1
+        position = found + len(OUT_TERMINATOR)
+    return position
+
+
+def find_reply(buffer: bytes, request: str) -> tuple[int, int]:
+    """
+    Frame a reply as PearlPC.proto reads it. Blank lines before the reply are skipped: the
+    emulator acknowledges setters with one and ends its id reply with another, which the
+    controller may not. The id reply itself ends at CR LF LF.
+    @param buffer: (bytes) received data
+    @param request: (str) request without terminator
+    @return: (tuple) start and end of the reply in buffer, where end is -1 if it is incomplete
+    """
+    start = 0
+    while buffer.startswith(OUT_TERMINATOR, start):
+        start += len(OUT_TERMINATOR)
+    if request == "id":
+        found = buffer.find(ID_TERMINATOR, start)
+        return start, -1 if found < 0 else found + len(ID_TERMINATOR)
+    end = reply_end(buffer[start:], expected_terminators(request))
+    return start, -1 if end < 0 else start + end
+
+
+def format_value(command: str, value: int, digits: int = 4) -> str:
+    """
+    Format a setter request, zero padding the value as PearlPC.proto does with %#04d.
+    @param command: (str) command prefix, e.g. "sp"
+    @param value: (int) value to send
+    @param digits: (int) number of digits the command takes
+    @raise ValueError: if the value is outside the range the command takes
+    """
+    minimum, maximum = VALUE_RANGES.get(command, (0, 10**digits - 1))
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{command} takes {minimum} to {maximum}, got {value}")
+    return f"{command}{int(value):0{digits}d}"
+
+
+@dataclass(frozen=True)
+class StatusReport:
+    """
+    The controller's reply to st, in report column order.
+    """
+
+    em_stop: bool
+    run: bool
+    reset_status: int
+    stop: bool
+    busy: bool
+    host_command: bool
+    auto_mode: bool
+    closed_loop: bool
+    seal_fail: bool
+    error_code: int
+    rate: int
+    min_pressure: int
+    setpoint: int
+    max_pressure: int
+    pressure: int
+    inputs: int
+
+
+@dataclass(frozen=True)
+class Limits:
+    """
+    The controller's reply to ls.
+    """
+
+    user_limit: int
+    pos_change: int
+    pos_offset: int
+    neg_change: int
+    neg_offset: int
+
+
+@dataclass(frozen=True)
+class Identity:
+    """
+    The controller's reply to id.
+    """
+
+    initial_id: int
+    secondary_id: int
+    version: str
+    fluid_type: str
+
+
+def _report_values(reply: str, header: str) -> list[str]:
+    lines = reply.split("\r\n")
+    for index, line in enumerate(lines[:-1]):
+        if line.startswith(header):
+            return lines[index + 1].split()
+    raise PearlPCError(f"No {header!r} report in reply {reply!r}")
+
+
+def parse_status(reply: str) -> StatusReport:
+    values = _report_values(reply, "Em Ru Re")
+    if len(values) != 16:
+        raise PearlPCError(f"Expected 16 status values, got {values}")
+    flags = [int(value) for value in values[:15]]
+    return StatusReport(
+        em_stop=bool(flags[0]),
+        run=bool(flags[1]),
+        reset_status=flags[2],
+        stop=bool(flags[3]),
+        busy=bool(flags[4]),
+        host_command=bool(flags[5]),
+        auto_mode=bool(flags[6]),
+        closed_loop=bool(flags[7]),
+        seal_fail=bool(flags[8]),
+        error_code=flags[9],
+        rate=flags[10],
+        min_pressure=flags[11],
+        setpoint=flags[12],
+        max_pressure=flags[13],
+        pressure=flags[14],
+        # the inputs are reported as a binary number, as read by %b in PearlPC.proto
+        inputs=int(values[15], 2),
+    )
+
+
+def parse_limits(reply: str) -> Limits:
+    values = _report_values(reply, "User")
+    if len(values) != 5:
+        raise PearlPCError(f"Expected 5 limit values, got {values}")
+    return Limits(*(int(value) for value in values))
+
+
+def parse_identity(reply: str) -> Identity:
+    match = IDENTITY_PATTERN.search(reply)
+    if match is None:
+        raise PearlPCError(f"Unrecognised id reply {reply!r}")
+    return Identity(int(match[1]), int(match[2]), match[3], match[4])
+
+
+def parse_memory(reply: str, address: int) -> int:
+    match = MEMORY_PATTERN.search(reply)
+    if match is None or int(match[1]) != address:
+        raise PearlPCError(f"Unexpected reply {reply!r} reading address {address}")
+    return int(float(match[2]))
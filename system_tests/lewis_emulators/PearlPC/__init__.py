@@ -2,4 +2,13 @@ from ..lewis_versions import LEWIS_LATEST
 from .device import SimulatedPearlPC
 
 framework_version = LEWIS_LATEST
+
+setups = {
+    "default": {"device_type": SimulatedPearlPC},
+    # time only moves when the step or advance_to backdoor functions are called
+    "lockstep": {
+        "device_type": SimulatedPearlPC,
+        "parameters": {"override_initial_data": {"lockstep": True}},
+    },
+}
 __all__ = ["SimulatedPearlPC"]
@@ -1,9 +1,15 @@
+import contextlib
 from collections import OrderedDict
 from enum import Enum
 
 from lewis.devices import StateMachineDevice
 
+from .pressure_trace import PressureTrace
+from .seal_fail import SealFailDetector
+from .state_schema import initialise_state, state_slots, validate
 from .states import DefaultState
+from .telemetry import CHUNK_ROWS, TelemetryRecorder
+from .transducers import NoiseSource, TransducerModel
 
 
 class ResetStatus(Enum):
@@ -19,6 +25,22 @@ class ResetStatus(Enum):
 
 
 class SimulatedPearlPC(StateMachineDevice):
+    # the scalar state is declared in STATE_SCHEMA; slots keep it out of the instance dict
+    __slots__ = state_slots(
+        "status_dictionary",
+        "is_giving_errors",
+        "out_error",
+        "out_terminator_in_error",
+        "pressure_trace",
+        "seal_fail_detector",
+        "cell_transducer",
+        "pump_transducer",
+        "noise_source",
+        "reply_delays",
+        "lockstep",
+        "telemetry",
+    )
+
     def _initialize_data(self, status_dictionary: dict[str, object] = None) -> None:
         if status_dictionary is None:
             status_dictionary = {}
@@ -30,6 +52,10 @@ class SimulatedPearlPC(StateMachineDevice):
         self.out_error = "}{<7f>w"
         self.out_terminator_in_error = ""
 
+        # time only moves in step and advance_to, not with the simulation cycle
+        self.lockstep = False
+        self.telemetry = None  # recorder of every simulation step, if recording
+
     def add_to_dict(self, value_id: str, unvalidated_value: object) -> None:
         """
         Add device state parameters to a dictionary.
@@ -50,46 +76,73 @@ class SimulatedPearlPC(StateMachineDevice):
         return OrderedDict([])
 
     def re_initialise(self) -> None:
-        self.connected = True
-
-        self.initial_id_prefix = 1111  # 4 digits
-        # "oil" or "pentane", set manually on the machine by the inst scientist
-        self.fluid_type = "Pentane"
-        self.secondary_id_prefix = 1111  # 4 digits
-        self.em_stop_status = 0  # Bool [0-1]
-        self.run_bit = 0  # Bool [0-1]
-        self.reset_value = 0  # [0-4]
-        self.piston_reset_phase = 0
-        self.stop_bit = 0  # Bool [0-1]
-        self.busy_bit = 0  # Bool [0-1]
-        self.go_status = 0
-        self.am_mode = 1  # auto mode (run from host) rather than manual
-        self.loop_mode = 0  # Bool [0-1]
-        self.seal_fail_value = 0
-        self.seal_fail_status = 0  # set to 1 if sudden pressure drop more than seal_fail_value
-        self.last_error_code = 0
-        self.pressure_rate = 0
-        self.min_value_pre_servoing = 0
-        self.setpoint_value = 0
-        self.max_value_pre_servoing = 0
-        self.inputs = 0  # a 9 digit number like 111111001 showing input status
-        self.cell_pressure = 0
-        self.pump_pressure = 0
-        self.transducer_difference_threshold = 2
-        self.algorithm = "a"
-        self.transducer = "0"
-        self.user_stop_limit = 1000
-        self.offset_plus = 0
-        self.offset_minus = 0
-        self.dir_plus = 0
-        self.dir_minus = 0
-
-        # for comms with poller thread
-        self.run_requested = 0
-        self.stop_requested = 0
-        self.reset_requested = 0
-        self.purge_requested = 0
-        self.ramping = 0  # ramping to setpoint as opposed to closed loop stabilisation?
+        if getattr(self, "pressure_trace", None) is not None:
+            self.pressure_trace.close()
+        initialise_state(self)
+        self.pressure_trace = None  # recorded pressures replayed in place of the ramp
+        self.seal_fail_detector = SealFailDetector()
+        self.cell_transducer = TransducerModel()
+        self.pump_transducer = TransducerModel()
+        self.noise_source = NoiseSource()
+        self.reply_delays = {}  # seconds by command, e.g. {"st": 0.5}
+
+    def process(self, dt: float = 0) -> None:
+        """
+        Called by Lewis every simulation cycle. In lockstep mode the cycle does nothing.
+        @param dt: (float) elapsed simulated time in seconds since the last cycle
+        """
+        if not self.lockstep:
+            super().process(dt)
+
+    def set_lockstep(self, enabled: bool) -> None:
+        """
+        Stop or restart time moving with the simulation cycle and status polls. In lockstep
+        mode it only moves in step and advance_to, so ramps, resets and purges take exactly
+        the same number of steps every run.
+        @param enabled: (bool) True for lockstep mode, False to run freely
+        """
+        self.lockstep = bool(enabled)
+
+    def step(self, n: int = 1, dt: float = 1.0) -> None:
+        """
+        Move time forward in steps, each advancing the simulated time then running one pass
+        of the controller's poller, as a status poll would.
+        @param n: (int) number of steps
+        @param dt: (float) simulated seconds per step
+        """
+        if n < 1:
+            raise ValueError(f"Number of steps must be at least 1, got {n}")
+        if dt <= 0:
+            raise ValueError(f"Step must be longer than 0 s, got {dt}")
+        for _ in range(n):
+            self.advance_time(dt)
+            self.poller()
+
+    def advance_to(self, t: float, dt: float = 1.0) -> None:
+        """
+        Step until the simulated time reaches t, shortening the last step to land on it.
+        @param t: (float) simulated time in seconds, as in simulation_time
+        @param dt: (float) simulated seconds per step
+        """
+        if dt <= 0:
+            raise ValueError(f"Step must be longer than 0 s, got {dt}")
+        if t < self.simulation_time:
+            raise ValueError(f"Time {t} s is before the simulated time {self.simulation_time} s")
+        while t - self.simulation_time > 1e-9:
+            self.step(1, min(dt, t - self.simulation_time))
+
+    def set_state(self, name: str, value: object) -> object:
+        """
+        Set a field of the state from a request, rejecting values the controller would not
+        accept, so that the rest of the emulator need not check them again.
+        @param name: (str) name of the field in STATE_SCHEMA
+        @param value: (object) new value
+        @return: (object) the value stored, as the field's type
+        @raise ValueError: if the value is not valid for the field
+        """
+        value = validate(name, value)
+        setattr(self, name, value)
+        return value
 
     def get_pressure(self) -> float | int:
         value = 0.0
@@ -169,13 +222,179 @@ class SimulatedPearlPC(StateMachineDevice):
             self.running()
         pressure = self.get_pressure()
         if pressure > self.user_stop_limit:
-            self.last_error_code = 12
+            self.raise_error(12)
+
+    def raise_error(self, error_code: int, stop: bool = True) -> None:
+        """
+        Record an error. A seal failure stays latched over any later error.
+        @param error_code: (int) error number, as read back from memory address 2
+        @param stop: (bool) whether the error stops the controller
+        """
+        if self.last_error_code != 8:
+            self.last_error_code = error_code
+        if stop:
             self.stop_requested = 1
 
+    def check_seal(self) -> None:
+        """
+        Trip a seal failure if the pressure has dropped suddenly by more than the sf value.
+        """
+        pressure = self.get_pressure()
+        if self.run_bit == 1 and self.ramping == 1 and pressure > self.setpoint_value:
+            # a commanded decrease is not a seal failure
+            self.seal_fail_detector.clear()
+            return
+        drop = self.seal_fail_detector.drop(self.simulation_time, pressure)
+        if 0 < self.seal_fail_value < drop and self.seal_fail_status == 0:
+            print(f"Seal failure: pressure dropped by {drop}")
+            self.seal_fail_status = 1
+            self.raise_error(8)
+
+    def advance_time(self, dt: float) -> None:
+        """
+        Move simulated time forward, replaying recorded pressures if a trace is loaded,
+        otherwise updating the readings of any modelled transducers, and check the seal.
+        @param dt: (float) elapsed simulated time in seconds
+        """
+        self.simulation_time += dt
+        if self.pressure_trace is not None:
+            self.cell_pressure, self.pump_pressure = self.pressure_trace.sample_at(
+                self.simulation_time - self.pressure_trace_start, self.pressure_trace_loop
+            )
+        elif self.cell_transducer.is_active or self.pump_transducer.is_active:
+            self.cell_transducer.advance(dt)
+            self.pump_transducer.advance(dt)
+            self.measure_pressures()
+        self.check_seal()
+        if self.telemetry is not None:
+            try:
+                self.telemetry.record(
+                    self.simulation_time,
+                    self.cell_pressure,
+                    self.pump_pressure,
+                    self.get_pressure(),
+                    self.setpoint_value,
+                    self.run_bit,
+                    self.stop_bit,
+                    self.busy_bit,
+                    self.reset_value,
+                    self.last_error_code,
+                )
+            except ValueError as error:
+                # state forced through the backdoor; the step is left out of the recording
+                print(f"Telemetry step not recorded: {error}")
+            except RuntimeError as error:
+                # the file cannot be written; the emulator carries on without recording
+                print(f"Telemetry recording stopped: {error.__cause__}")
+                telemetry, self.telemetry = self.telemetry, None
+                with contextlib.suppress(RuntimeError):
+                    telemetry.close()
+
+    def start_recording(self, path: str, chunk_rows: int = CHUNK_ROWS) -> None:
+        """
+        Record every simulation step to a telemetry file, replacing any recording in progress.
+        Read it back with telemetry.TelemetryReader.
+        @param path: (str) file to write, replaced if it exists
+        @param chunk_rows: (int) rows held in memory before they are written
+        """
+        self.stop_recording()
+        self.telemetry = TelemetryRecorder(path, chunk_rows)
+        print(f"Recording telemetry to {path}")
+
+    def stop_recording(self) -> None:
+        """
+        Write out any recorded steps still held and close the telemetry file.
+        """
+        if self.telemetry is not None:
+            telemetry, self.telemetry = self.telemetry, None
+            telemetry.close()
+            print(f"Recorded {telemetry.rows} steps of telemetry to {telemetry.path}")
+
+    def measure_pressures(self) -> None:
+        """
+        Update the transducer readings from the true pressure.
+        """
+        self.cell_pressure = self.cell_transducer.measure(self.true_pressure, self.noise_source)
+        self.pump_pressure = self.pump_transducer.measure(self.true_pressure, self.noise_source)
+
+    def set_transducer_model(
+        self, transducer: int, noise: float = 0.0, offset: float = 0.0, drift_rate: float = 0.0
+    ) -> None:
+        """
+        Model the errors of one transducer's readings.
+        @param transducer: (int) 1 for the cell transducer, 2 for the pump transducer
+        @param noise: (float) standard deviation of the reading noise in bar
+        @param offset: (float) fixed offset of the reading in bar
+        @param drift_rate: (float) drift of the reading in bar/min, until the transducer reset
+        """
+        if transducer not in (1, 2):
+            raise ValueError(f"Transducer must be 1 (cell) or 2 (pump), got {transducer}")
+        model = TransducerModel(noise, offset, drift_rate)
+        if transducer == 1:
+            self.cell_transducer = model
+        else:
+            self.pump_transducer = model
+        self.measure_pressures()
+
+    def set_reply_delay(self, command: str, delay: float) -> None:
+        """
+        Delay the replies to a query, as a slow or saturated serial link would.
+        Later replies on the same connection wait behind the delayed one.
+        @param command: (str) query to delay: "st", "ls", "vr" or "id"
+        @param delay: (float) delay in seconds, or 0 for none
+        """
+        if delay > 0:
+            self.reply_delays[command] = delay
+        else:
+            self.reply_delays.pop(command, None)
+
+    def seed_noise(self, seed: int) -> None:
+        """
+        Restart the transducer noise from a seed, for reproducible readings.
+        """
+        self.noise_source = NoiseSource(seed)
+
+    def transducer_reset(self) -> None:
+        """
+        Zero the drift of both transducers.
+        """
+        self.cell_transducer.zero()
+        self.pump_transducer.zero()
+        self.measure_pressures()
+
+    def load_pressure_trace(
+        self, path: str, sample_interval: float = 1.0, loop: bool = False, dtype: str = "<f8"
+    ) -> None:
+        """
+        Replay recorded cell and pump pressures from the current simulated time onwards.
+        The trace is memory mapped, so large captures are not read into memory.
+        @param path: (str) .npy file or flat binary file of interleaved cell/pump samples
+        @param sample_interval: (float) time between samples in seconds
+        @param loop: (bool) restart the trace when it is exhausted rather than holding the end
+        @param dtype: (str) sample type of a flat binary file, e.g. "<f8" or "<i4"
+        """
+        trace = PressureTrace(path, sample_interval, dtype)
+        self.clear_pressure_trace()
+        print(f"Replaying {trace.length} pressure samples from {path}")
+        self.pressure_trace = trace
+        self.pressure_trace_start = self.simulation_time
+        self.pressure_trace_loop = loop
+        self.advance_time(0.0)
+
+    def clear_pressure_trace(self) -> None:
+        """
+        Stop replaying recorded pressures, holding the last replayed values.
+        """
+        if self.pressure_trace is not None:
+            self.pressure_trace.close()
+            self.pressure_trace = None
+            self.true_pressure = self.pump_pressure
+
     # need to do closed loop better
     def running(self) -> None:
         pressure = self.get_pressure()
-        if self.ramping == 1:
+        # recorded pressures take the place of the synthetic ramp
+        if self.ramping == 1 and self.pressure_trace is None:
             incr = abs(pressure - self.setpoint_value)
             if incr == 0:
                 if self.loop_mode == 0:
@@ -185,15 +404,19 @@ class SimulatedPearlPC(StateMachineDevice):
             if incr > self.pressure_rate:
                 incr = self.pressure_rate
             if pressure < self.setpoint_value:
-                self.pump_pressure = self.pump_pressure + incr
-                self.cell_pressure = self.pump_pressure  # for simplicity
+                self.true_pressure = self.true_pressure + incr
             else:
-                self.pump_pressure = self.pump_pressure - incr
-                self.cell_pressure = self.pump_pressure  # for simplicity
+                self.true_pressure = self.true_pressure - incr
+            self.measure_pressures()
+        elif self.loop_mode == 1 and self.pressure_trace is None:
+            # in closed loop, re-servo to the setpoint if the pressure leaves the mn/mx band
+            if self.max_value_pre_servoing > 0 and not (
+                self.min_value_pre_servoing <= pressure <= self.max_value_pre_servoing
+            ):
+                self.ramping = 1
 
         if abs(self.cell_pressure - self.pump_pressure) > self.transducer_difference_threshold:
-            self.last_error_code = 10
-            self.stop_requested = 1
+            self.raise_error(10)
 
     def set_em_stop_status(self, em_stop_status: int) -> None:
         """
@@ -203,7 +426,7 @@ class SimulatedPearlPC(StateMachineDevice):
         requesting emergency stop circuit - range [0-1]
         """
         print(f"Received EM stop circuit status: {em_stop_status}")
-        self.em_stop_status = em_stop_status
+        self.set_state("em_stop_status", em_stop_status)
         self.add_to_dict(value_id="EM", unvalidated_value=self.em_stop_status)
 
     def set_ru(self, run_bit: int) -> None:
@@ -213,7 +436,7 @@ class SimulatedPearlPC(StateMachineDevice):
         pumping to achieve the setpoint pressure - range [0-1]
         """
         print(f"Received run bit: {run_bit}")
-        self.run_bit = run_bit
+        self.set_state("run_bit", run_bit)
         self.add_to_dict(value_id="ru", unvalidated_value=self.run_bit)
 
     def set_re(self, piston_reset_phase: int) -> None:
@@ -222,7 +445,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @param reset_value: (int) value representing each stage during piston reset - range [0-4]
         """
         print(f"Received reset phase value: {piston_reset_phase}")
-        self.reset_value = piston_reset_phase
+        self.set_state("reset_value", piston_reset_phase)
         self.add_to_dict(value_id="re", unvalidated_value=self.piston_reset_phase)
 
     def set_pu(self, purge_value: int) -> None:
@@ -231,7 +454,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @param purge_value: (int) value representing each stage during system purge - [2,4]
         """
         print(f"Received purge phase value: {purge_value}")
-        self.reset_value = purge_value
+        self.set_state("reset_value", purge_value)
         self.add_to_dict(value_id="re", unvalidated_value=self.reset_value)
 
     def set_stop_bit(self, stop_bit: int) -> None:
@@ -242,7 +465,7 @@ class SimulatedPearlPC(StateMachineDevice):
         the end of a move or by request - range [0-1]
         """
         print(f"Received stop bit command: {stop_bit}")
-        self.stop_bit = stop_bit
+        self.set_state("stop_bit", stop_bit)
         self.add_to_dict(value_id="St", unvalidated_value=self.stop_bit)
 
     def set_by(self, busy_bit: int) -> None:
@@ -252,7 +475,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @type busy_bit: (int) integer representing if device is mechanically active - range [0-1]
         """
         print(f"Received busy bit {busy_bit}")
-        self.busy_bit = busy_bit
+        self.set_state("busy_bit", busy_bit)
         self.add_to_dict(value_id="by", unvalidated_value=self.busy_bit)
 
     def set_sf_status(self, sf_status: int) -> None:
@@ -262,7 +485,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @type sf_bit: (int) integer representing if seal has failed - range [0-1]
         """
         print(f"Received seal fail bit {sf_status}")
-        self.seal_fail_status = sf_status
+        self.set_state("seal_fail_status", sf_status)
         self.add_to_dict(value_id="sf_status", unvalidated_value=self.seal_fail_status)
 
     def set_go(self, go_status: int) -> None:
@@ -273,7 +496,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @param go_status (int) set if command initiated by host - range [0-1]
         """
         print(f"Received GO status: {go_status}")
-        self.go_status = go_status
+        self.set_state("go_status", go_status)
         self.add_to_dict(value_id="GO", unvalidated_value=self.go_status)
 
     def set_am(self, am_mode: int) -> None:
@@ -282,7 +505,7 @@ class SimulatedPearlPC(StateMachineDevice):
         @param am_mode: (int) Set Auto/manual switch position - range [0-1]
         """
         print(f"Received last AM modeL: {am_mode}")
-        self.am_mode = am_mode
+        self.set_state("am_mode", am_mode)
         self.add_to_dict(value_id="AM", unvalidated_value=self.am_mode)
 
     def set_er(self, last_error_code: int) -> None:
@@ -291,9 +514,14 @@ class SimulatedPearlPC(StateMachineDevice):
         @param last_error_code: (int) Last error status received by device - range [0-19]
         """
         print(f"Received last error code: {last_error_code}")
-        self.last_error_code = last_error_code
+        self.set_state("last_error_code", last_error_code)
         self.add_to_dict(value_id="ER", unvalidated_value=self.last_error_code)
 
     def set_pressures(self, pump_pressure: int, cell_pressure: int) -> None:
+        """
+        Set the transducer readings, and the true pressure to the pump reading.
+        While a transducer model is active the readings are regenerated every cycle.
+        """
         self.pump_pressure = pump_pressure
         self.cell_pressure = cell_pressure
+        self.true_pressure = pump_pressure
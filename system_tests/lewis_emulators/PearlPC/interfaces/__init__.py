@@ -1,3 +1,3 @@
-from .stream_interface import PearlPCStreamInterface
+from .stream_interface import PearlPCAsyncioStreamInterface, PearlPCStreamInterface
 
-__all__ = ["PearlPCStreamInterface"]
+__all__ = ["PearlPCAsyncioStreamInterface", "PearlPCStreamInterface"]
@@ -0,0 +1,123 @@
+import asyncio
+from typing import ClassVar
+
+from lewis.core.adapters import Adapter
+from lewis.core.logging import has_log
+
+
+@has_log
+class AsyncioStreamAdapter(Adapter):
+    """
+    Serves a stream interface to many concurrent clients with asyncio.
+
+    Each connection has its own request queue, so a client may pipeline requests and
+    receives its replies in order. Requests from all connections are handled one at a time
+    under the device lock, so every client sees the same device state. When a client reads
+    its replies slowly, only that connection waits for its writes to drain. Its queue then
+    fills and it is no longer read from, which pushes back on the client over TCP while other
+    connections, such as the IOC, carry on being served. A reply the interface asks to delay
+    is held back the same way, outside the device lock.
+
+    Available adapter options are:
+     - bind_address: IP of network adapter to bind on (defaults to 0.0.0.0, or all adapters)
+     - port: Port to listen on (defaults to 9999)
+     - max_pipelined_requests: Requests queued per connection before reading pauses
+     - write_buffer_limit: Bytes of unsent replies per connection before its writes wait
+    """
+
+    default_options: ClassVar[dict[str, object]] = {
+        "bind_address": "0.0.0.0",
+        "port": 9999,
+        "max_pipelined_requests": 16,
+        "write_buffer_limit": 65536,
+    }
+
+    def __init__(self, options: dict[str, object] | None = None) -> None:
+        super().__init__(options)
+        self._loop = None
+        self._server = None
+        self._connections = set()
+
+    def start_server(self) -> None:
+        if self._server is None:
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(
+                    self._serve_connection, self._options.bind_address, self._options.port
+                )
+            )
+
+    def stop_server(self) -> None:
+        if self._server is not None:
+            self._loop.run_until_complete(self._close_connections())
+            self._loop.close()
+            self._server = None
+            self._loop = None
+
+    async def _close_connections(self) -> None:
+        # gathered inside the loop, which is not the thread's current event loop
+        self._server.close()
+        connections = list(self._connections)
+        for connection in connections:
+            connection.cancel()
+        await asyncio.gather(self._server.wait_closed(), *connections, return_exceptions=True)
+
+    @property
+    def is_running(self) -> bool:
+        return self._server is not None
+
+    def handle(self, cycle_delay: float = 0.1) -> None:
+        """
+        Run the event loop for approximately cycle_delay seconds.
+        @param cycle_delay: (float) time to spend serving connections
+        """
+        self._loop.run_until_complete(asyncio.sleep(cycle_delay))
+
+    async def _serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        peer = writer.get_extra_info("peername")
+        self.log.info("Client connected from %s", peer)
+        writer.transport.set_write_buffer_limits(high=self._options.write_buffer_limit)
+        requests = asyncio.Queue(maxsize=self._options.max_pipelined_requests)
+        receiver = asyncio.ensure_future(self._receive(reader, requests))
+        responder = asyncio.ensure_future(self._respond(requests, writer))
+        try:
+            # the connection is closed as soon as either side of it ends
+            await asyncio.wait((receiver, responder), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            receiver.cancel()
+            responder.cancel()
+            results = await asyncio.gather(receiver, responder, return_exceptions=True)
+            writer.close()
+            self._connections.discard(connection)
+        for result in results:
+            if isinstance(
+                result, (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError)
+            ):
+                self.log.info("Closing connection to client %s: %s", peer, result)
+            elif isinstance(result, Exception):
+                self.log.error("Closing connection to client %s", peer, exc_info=result)
+
+    async def _receive(self, reader: asyncio.StreamReader, requests: asyncio.Queue) -> None:
+        terminator = self.interface.in_terminator.encode()
+        while True:
+            line = await reader.readuntil(terminator)
+            await requests.put(line[: -len(terminator)].decode(errors="replace"))
+
+    async def _respond(self, requests: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        while True:
+            request = await requests.get()
+            with self.device_lock:
+                reply = self.interface.process_request(request)
+                delay = self.interface.take_reply_delay()
+            if delay:
+                # a slow link: only this connection waits
+                await asyncio.sleep(delay)
+            if reply is not None:
+                writer.write(reply.encode())
+                await writer.drain()
+            # let other connections in between pipelined requests
+            await asyncio.sleep(0)
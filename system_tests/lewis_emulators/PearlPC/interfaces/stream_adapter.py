@@ -0,0 +1,62 @@
+import time
+from collections import deque
+
+from lewis.adapters.stream import StreamAdapter, StreamHandler, StreamServer
+
+
+class DelayedReplyStreamHandler(StreamHandler):
+    """
+    A connection of the standard stream adapter whose replies can be held back, as a slow
+    serial link would deliver them. Held replies are written by process, which the adapter
+    calls every cycle, so neither the device lock nor other connections wait for them.
+    Replies stay in order: one following a held reply waits behind it.
+    """
+
+    def __init__(self, sock: object, target: object, stream_server: StreamServer) -> None:
+        super().__init__(sock, target, stream_server)
+        self._held = deque()  # (time due, reply)
+
+    def _send_reply(self, reply: str | None) -> None:
+        delay = self._target.take_reply_delay()
+        if reply is None:
+            return
+        if delay or self._held:
+            due = time.monotonic() + delay
+            if self._held:
+                due = max(due, self._held[-1][0])
+            self._held.append((due, reply))
+        else:
+            super()._send_reply(reply)
+
+    def process(self, msec: int) -> None:
+        super().process(msec)
+        now = time.monotonic()
+        while self._held and self._held[0][0] <= now:
+            super()._send_reply(self._held.popleft()[1])
+
+
+class DelayedReplyStreamServer(StreamServer):
+    def handle_accept(self) -> None:
+        pair = self.accept()
+        if pair is not None:
+            sock, _ = pair
+            self._accepted_connections.append(DelayedReplyStreamHandler(sock, self.target, self))
+
+
+class DelayedReplyStreamAdapter(StreamAdapter):
+    """
+    The standard Lewis stream adapter, with connections that honour reply delays.
+    """
+
+    def start_server(self) -> None:
+        if self._server is None:
+            if self._options.telnet_mode:
+                self.interface.in_terminator = "\r\n"
+                self.interface.out_terminator = "\r\n"
+
+            self._server = DelayedReplyStreamServer(
+                self._options.bind_address,
+                self._options.port,
+                self.interface,
+                self.device_lock,
+            )
@@ -1,8 +1,14 @@
+import copy
+
 from lewis.adapters.stream import StreamInterface
 from lewis.core.logging import has_log
 from lewis.utils.command_builder import CmdBuilder
 from lewis.utils.replies import conditional_reply
 
+from ..state_schema import render_status_values
+from ..transducers import parse_transducer_setting
+from .stream_adapter import DelayedReplyStreamAdapter
+
 
 @has_log
 class PearlPCStreamInterface(StreamInterface):
@@ -55,8 +61,74 @@ class PearlPCStreamInterface(StreamInterface):
     in_terminator = "\r"
     out_terminator = "\r\n"
 
+    # (handler name, bound to the interface rather than the device, Func) per command, kept
+    # from the first binding in each class so later instances reuse its compiled patterns
+    # instead of compiling and checking every command again
+    _command_table = None
+
     def __init__(self) -> None:
         super().__init__()
+        self._reply_delay = 0.0
+
+    @property
+    def adapter(self) -> type:
+        return DelayedReplyStreamAdapter
+
+    def _bind_device(self) -> None:
+        table = type(self).__dict__.get("_command_table")
+        if table is None:
+            super()._bind_device()
+            type(self)._command_table = [
+                (bound.func.__name__, bound.func.__self__ is self, bound)
+                for bound in self.bound_commands
+            ]
+            return
+        self.bound_commands = []
+        for name, on_interface, template in table:
+            bound = copy.copy(template)
+            bound.func = getattr(self if on_interface else self.device, name)
+            self.bound_commands.append(bound)
+
+    def process_request(self, request: str) -> str | None:
+        """
+        Handle a single request outside the Lewis stream adapter, as its StreamHandler does:
+        the first matching command handles it and any exception goes to handle_error.
+        The caller is responsible for holding the device lock.
+        @param request: (str) request without the in terminator
+        @return: (str) reply including the out terminator, or None if there is no reply
+        """
+        raw_request = request.encode()
+        try:
+            cmd = next((cmd for cmd in self.bound_commands if cmd.can_process(raw_request)), None)
+            if cmd is None:
+                raise RuntimeError("None of the device's commands matched.")
+            reply = cmd.process_request(raw_request)
+        except Exception as error:  # noqa: BLE001 - every error is replied to, as in Lewis
+            reply = self.handle_error(raw_request, error)
+        if reply is None:
+            return None
+        return reply + self.out_terminator
+
+    def _reply(self, command: str, reply: str) -> str:
+        """
+        Apply the device's reply delay and error mode to the reply to a query. The delay is
+        left for the adapter to apply when it writes the reply, after releasing the device.
+        @param command: (str) query replied to, e.g. "st"
+        @param reply: (str) correct reply
+        @return: (str) reply to send
+        """
+        self._reply_delay = self._device.reply_delays.get(command, 0.0)
+        if self._device.is_giving_errors:
+            return self._device.out_error
+        return reply
+
+    def take_reply_delay(self) -> float:
+        """
+        Called by the adapter after each request.
+        @return: (float) seconds to hold back the reply to the last request before writing it
+        """
+        delay, self._reply_delay = self._reply_delay, 0.0
+        return delay
 
     @conditional_reply("connected")
     def get_st(self) -> str:
@@ -65,27 +137,16 @@ class PearlPCStreamInterface(StreamInterface):
         @return: (str) A formatted string containing all
         set device parameters describing current device status.
         """
-        self._device.poller()
-        return (
+        if not self._device.lockstep:
+            self._device.poller()
+        return self._reply(
+            "st",
             f"Status Report{self.out_terminator}"
             f"Em Ru Re St By Go AM sl sf Er   ra    mn    sp    mx  Press    Inputs{self.out_terminator}"  # noqa: E501
-            f"{self._device.em_stop_status} "
-            f"{self._device.run_bit} "
-            f"{self._device.reset_value} "
-            f"{self._device.stop_bit} "
-            f"{self._device.busy_bit} "
-            f"{self._device.go_status} "
-            f"{self._device.am_mode} "
-            f"{self._device.loop_mode} "
-            f"{self._device.seal_fail_status} "
-            f"{self._device.last_error_code} "
-            f"{self._device.pressure_rate} "
-            f"{self._device.min_value_pre_servoing} "
-            f"{self._device.setpoint_value} "
-            f"{self._device.max_value_pre_servoing} "
+            f"{render_status_values(self._device)} "
             f"{self._device.get_pressure()} "
             f"{self._device.inputs:09d}{self.out_terminator}"
-            f"OK"
+            f"OK",
         )
 
     @conditional_reply("connected")
@@ -98,7 +159,10 @@ class PearlPCStreamInterface(StreamInterface):
             f"ID prefix set to: {self._device.initial_id_prefix} {self._device.secondary_id_prefix}"
         )
 
-        return f"\r\n{self._device.initial_id_prefix:04d} {self._device.secondary_id_prefix:04d} ISIS PEARL INTENSIFIER CONTROLLER V2.4 {self._device.fluid_type}\r\n\n"  # noqa: E501
+        return self._reply(
+            "id",
+            f"\r\n{self._device.initial_id_prefix:04d} {self._device.secondary_id_prefix:04d} ISIS PEARL INTENSIFIER CONTROLLER V2.4 {self._device.fluid_type}\r\n\n",  # noqa: E501
+        )
 
     @conditional_reply("connected")
     def set_fluid_type(self, fluid_type: int) -> None:
@@ -113,10 +177,7 @@ class PearlPCStreamInterface(StreamInterface):
         @param id_prefix: (int) Prefix to ID for a unit - range [0000-9999]
         """
         print(f"SI prefix value received: {id_prefix}")
-        if id_prefix < 0 or id_prefix > 9999:
-            print("ERROR: invalid si value")
-
-        self._device.initial_id_prefix = id_prefix
+        self._device.set_state("initial_id_prefix", id_prefix)
         self._device.add_to_dict(value_id="si", unvalidated_value=self._device.initial_id_prefix)
         return ""
 
@@ -129,9 +190,7 @@ class PearlPCStreamInterface(StreamInterface):
         @param secondary_id_prefix: (int) Prefix to ID for a unit - range [0000-9999]
         """
         print(f"SD prefix value received: {secondary_id_prefix}")
-        if secondary_id_prefix < 0 or secondary_id_prefix > 9999:
-            print("ERROR: invalid sd value")
-        self._device.secondary_id_prefix = secondary_id_prefix
+        self._device.set_state("secondary_id_prefix", secondary_id_prefix)
         self._device.add_to_dict(value_id="sd", unvalidated_value=self._device.secondary_id_prefix)
         return ""
 
@@ -145,7 +204,7 @@ class PearlPCStreamInterface(StreamInterface):
             self._device.reset()  # set phase to resetting, this starts reset
         else:
             print("ERROR: cannot reset as pressure too high")
-            self._device.last_error_code = 1
+            self._device.raise_error(1, stop=False)
         return ""
 
     @conditional_reply("connected")
@@ -158,7 +217,7 @@ class PearlPCStreamInterface(StreamInterface):
             self._device.purge()  # set phase to purging, this starts purge
         else:
             print("ERROR: cannot purge as pressure too high")
-            self._device.last_error_code = 1
+            self._device.raise_error(1, stop=False)
         return ""
 
     @conditional_reply("connected")
@@ -174,9 +233,7 @@ class PearlPCStreamInterface(StreamInterface):
         @param sloop: (int) integer value setting system to open or closed loop - range [0-1]
         """
         print(f"sloop value recieved: {sloop}")
-        if sloop < 0 or sloop > 1:
-            print("ERROR: invalid sloop")
-        self._device.loop_mode = sloop
+        self._device.set_state("loop_mode", sloop)
         self._device.add_to_dict(value_id="sloop", unvalidated_value=self._device.loop_mode)
         return ""
 
@@ -188,9 +245,7 @@ class PearlPCStreamInterface(StreamInterface):
         @param seal_fail_value: (int) Seal Fail Mode Trigger Value - range [0001-0999]
         """
         print(f"Seal Fail mode trigger value received: {seal_fail_value}")
-        if seal_fail_value < 1 or seal_fail_value > 999:
-            print("ERROR: invalid seal fail value")
-        self._device.seal_fail_value = seal_fail_value
+        self._device.set_state("seal_fail_value", seal_fail_value)
         self._device.add_to_dict(value_id="sf", unvalidated_value=self._device.seal_fail_value)
         return ""
 
@@ -215,12 +270,9 @@ class PearlPCStreamInterface(StreamInterface):
         @param pressure_rate: (int) Pressure rate within range [0001-0040]
         """
         print(f"Pressure Rate Received: {pressure_rate}")
-        if pressure_rate < 0 or pressure_rate > 40:
-            print("ERROR: invalid pressure rate")
+        self._device.set_state("pressure_rate", pressure_rate)
         if pressure_rate == 0:
             self._device.pressure_rate = 10  # maximum slew rate of the motor?
-        else:
-            self._device.pressure_rate = pressure_rate
         self._device.add_to_dict(value_id="ra", unvalidated_value=self._device.pressure_rate)
         return ""
 
@@ -231,10 +283,8 @@ class PearlPCStreamInterface(StreamInterface):
         This will only be acted upon in closed loop mode.
         @param min_measured: (int) minimum pressure value before re-servoing - range [0001-9999]
         """
-        if min_measured < 1 or min_measured > 9999:
-            print("ERROR: invalid min measured")
         print(f"Minimum value before re-servoing received: {min_measured}")
-        self._device.min_value_pre_servoing = min_measured
+        self._device.set_state("min_value_pre_servoing", min_measured)
         self._device.add_to_dict(
             value_id="mn", unvalidated_value=self._device.min_value_pre_servoing
         )
@@ -249,9 +299,7 @@ class PearlPCStreamInterface(StreamInterface):
         @param setpoint: (int) Set Point trigger value - range [0001-1000]
         """
         print(f"Setpoint value received: {setpoint}")
-        if setpoint < 1 or setpoint > 1000:
-            print("ERROR: invalid setpoint")
-        self._device.setpoint_value = setpoint
+        self._device.set_state("setpoint_value", setpoint)
         self._device.add_to_dict(value_id="sp", unvalidated_value=self._device.setpoint_value)
         return ""
 
@@ -261,10 +309,8 @@ class PearlPCStreamInterface(StreamInterface):
         set the maximum measured value before re-servoing
         @param max_measured: (integer) maximum measured value before re-servoing - range [0001-9999]
         """
-        if max_measured < 1 or max_measured > 9999:
-            print("ERROR: invalid max measured")
         print(f"Maximum measured value before re-servoing received: {max_measured}")
-        self._device.max_value_pre_servoing = max_measured
+        self._device.set_state("max_value_pre_servoing", max_measured)
         self._device.add_to_dict(
             value_id="mx", unvalidated_value=self._device.max_value_pre_servoing
         )
@@ -290,28 +336,28 @@ class PearlPCStreamInterface(StreamInterface):
         return ""
 
     @conditional_reply("connected")
-    def set_t(self, value: int) -> str:
+    def set_t(self, value: str) -> str:
         print(f"set_transducer  {value}")
-        self._device.transducer = value
+        self._device.set_state("transducer", value)
+        self._device.set_transducer_model(*parse_transducer_setting(value))
         return ""
 
     @conditional_reply("connected")
     def set_th(self, value: int) -> str:
         print(f"set_transducer threshold {value}")
-        if value < 1 or value > 999:
-            print("ERROR: invalid th value")
-        self._device.transducer_difference_threshold = value
+        self._device.set_state("transducer_difference_threshold", value)
         return ""
 
     @conditional_reply("connected")
     def transducer_reset(self) -> str:
         print("transducer_reset")
+        self._device.transducer_reset()
         return ""
 
     @conditional_reply("connected")
     def set_algorithm(self, value: str) -> str:
         print(f"set_algorithm {value}")
-        self._device.algorithm = value
+        self._device.set_state("algorithm", value)
         return ""
 
     @conditional_reply("connected")
@@ -322,18 +368,17 @@ class PearlPCStreamInterface(StreamInterface):
     @conditional_reply("connected")
     def set_user_stop_limit(self, value: int) -> str:
         print(f"set_user_stop_limit {value}")
-        if value < 0 or value > 9999:
-            print("ERROR: set_user_stop_limit")
-        self._device.user_stop_limit = value
+        self._device.set_state("user_stop_limit", value)
         return ""
 
     @conditional_reply("connected")
     def show_limits(self) -> str:
         print("show_limits")
-        return (
+        return self._reply(
+            "ls",
             f"User +Change +Offset -Change -Offset{self.out_terminator}"
             f"{self._device.user_stop_limit} {self._device.dir_plus} {self._device.offset_plus} {self._device.dir_minus} {self._device.offset_minus}{self.out_terminator}"  # noqa: E501
-            f"OK"
+            f"OK",
         )
 
     @conditional_reply("connected")
@@ -361,20 +406,41 @@ class PearlPCStreamInterface(StreamInterface):
             value = self._device.seal_fail_value
         else:
             print(f"ERROR: read memory error address {address}")
-        return f"vr{address:04d} {value}"
+        return self._reply("vr", f"vr{address:04d} {value}")
 
-    def set_pos_lim(self, value: str) -> str:
-        self._device.dir_plus = value
+    @conditional_reply("connected")
+    def set_pos_lim(self, value: int) -> str:
+        self._device.set_state("dir_plus", value)
         return ""
 
-    def set_neg_lim(self, value: str) -> str:
-        self._device.dir_minus = value
+    @conditional_reply("connected")
+    def set_neg_lim(self, value: int) -> str:
+        self._device.set_state("dir_minus", value)
         return ""
 
-    def set_pos_offset(self, value: str) -> str:
-        self._device.offset_plus = value
+    @conditional_reply("connected")
+    def set_pos_offset(self, value: int) -> str:
+        self._device.set_state("offset_plus", value)
         return ""
 
-    def set_neg_offset(self, value: str) -> str:
-        self._device.offset_minus = value
+    @conditional_reply("connected")
+    def set_neg_offset(self, value: int) -> str:
+        self._device.set_state("offset_minus", value)
         return ""
+
+
+class PearlPCAsyncioStreamInterface(PearlPCStreamInterface):
+    """
+    The PearlPC command set served to many concurrent clients by AsyncioStreamAdapter.
+    Select it with -p "stream_asyncio: {bind_address: 127.0.0.1, port: 57677}", on its own
+    or alongside the standard stream protocol on another port.
+    """
+
+    protocol = "stream_asyncio"
+
+    @property
+    def adapter(self) -> type:
+        # imported here so that emulators on the standard adapter do not import asyncio
+        from .asyncio_adapter import AsyncioStreamAdapter
+
+        return AsyncioStreamAdapter
@@ -0,0 +1,263 @@
+"""
+Pre-warmed launcher for PearlPC emulators.
+
+Starting Lewis in a new interpreter spends most of its time importing Lewis, its control
+server dependencies and the emulator package. The launcher does that once, then forks a
+child for each emulator it is asked for, so an emulator listens within milliseconds of the
+request. Run it once per CI shard and ask it for emulators over its control port:
+
+    python -m system_tests.lewis_emulators.PearlPC.launcher --control 127.0.0.1:57600
+
+Each request is one line of JSON, answered with one line of JSON:
+
+    {"command": "launch", "arguments": [...Lewis arguments...]}  ->  {"pid": 1234}
+    {"command": "stop", "pid": 1234}                             ->  {"pid": 1234}
+
+Where os.fork is not available (Windows), emulators are launched as new Lewis processes,
+which works the same but without the saving.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+import traceback
+from collections.abc import Iterable
+
+SYSTEM_TESTS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEVICE_PACKAGE = "lewis_emulators"
+DEVICE = "PearlPC"
+# how long a stopped emulator has to exit before it is killed
+STOP_TIMEOUT = 10.0
+
+# emulators started as processes when os.fork is not available
+_processes = {}
+# process ids of forked emulators that have not been reaped, the only other processes stop
+# will signal; an id leaves the set as its emulator is reaped, before it can be reused
+_children = set()
+
+
+def lewis_arguments(
+    port: int, protocol: str = "stream", bind_address: str = "127.0.0.1", setup: str = "default"
+) -> list:
+    """
+    @param port: (int) port for the emulator to listen on
+    @param protocol: (str) Lewis protocol to expose the emulator on
+    @param bind_address: (str) address for the emulator to listen on
+    @param setup: (str) device setup, e.g. "lockstep"
+    @return: (list) Lewis arguments for a PearlPC emulator, as the IOC test framework runs it
+    """
+    return [
+        "-a",
+        SYSTEM_TESTS_DIR,
+        "-k",
+        DEVICE_PACKAGE,
+        DEVICE,
+        "-s",
+        setup,
+        "-p",
+        f"{protocol}: {{bind_address: {bind_address}, port: {port}}}",
+    ]
+
+
+def prewarm(add_path: str = SYSTEM_TESTS_DIR, device_package: str = DEVICE_PACKAGE) -> None:
+    """
+    Import Lewis and the emulator package, and bind the command tables, so that forked
+    children start with all of it done. The package is imported under the name Lewis gives
+    it with -a and -k, otherwise the children would import it again.
+    @param add_path: (str) path Lewis is given with -a
+    @param device_package: (str) package Lewis is given with -k
+    """
+    importlib.import_module("lewis.scripts.run")
+    from lewis.core.simulation import SimulationFactory
+
+    if add_path not in sys.path:
+        sys.path.append(add_path)
+    SimulationFactory(device_package)
+    package = importlib.import_module(f"{device_package}.{DEVICE}")
+    interfaces = importlib.import_module(f"{device_package}.{DEVICE}.interfaces")
+    for interface_class in (
+        interfaces.PearlPCStreamInterface,
+        interfaces.PearlPCAsyncioStreamInterface,
+    ):
+        interface = interface_class()
+        interface.device = package.SimulatedPearlPC()
+
+
+def launch(arguments: list, inherited: Iterable[socket.socket] = ()) -> int:
+    """
+    Start an emulator, forking this process when possible.
+    @param arguments: (list) Lewis command line arguments
+    @param inherited: (iterable) sockets for a forked child to close
+    @return: (int) process id of the emulator
+    """
+    if not hasattr(os, "fork"):
+        process = subprocess.Popen([sys.executable, "-m", "lewis", *arguments])
+        _processes[process.pid] = process
+        return process.pid
+    pid = os.fork()
+    if pid:
+        _children.add(pid)
+        return pid
+    exit_code = 0
+    try:
+        for inherited_socket in inherited:
+            inherited_socket.close()
+        from lewis.scripts.run import run_simulation
+
+        run_simulation(arguments)
+    except SystemExit as error:
+        # e.g. from Lewis's argument parser, which has said why
+        exit_code = error.code if isinstance(error.code, int) else int(error.code is not None)
+    except BaseException:  # noqa: BLE001 - the child must not return into the launcher
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def _reaped(pid: int) -> bool:
+    """
+    Reap a forked emulator if it has exited.
+    @param pid: (int) process id of a forked emulator
+    @return: (bool) whether the emulator has exited, and so been dropped from _children
+    """
+    try:
+        exited, _ = os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        exited = pid
+    if exited:
+        _children.discard(pid)
+    return bool(exited)
+
+
+def reap() -> None:
+    """
+    Reap every forked emulator that has exited, e.g. after failing to start.
+    """
+    for pid in list(_children):
+        _reaped(pid)
+
+
+def stop(pid: int) -> None:
+    """
+    Stop an emulator started by launch.
+    @param pid: (int) process id returned by launch
+    @raise ValueError: if the process was not started by launch
+    """
+    process = _processes.pop(pid, None)
+    if process is not None:
+        process.terminate()
+        try:
+            process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        return
+    if pid not in _children:
+        raise ValueError(f"Process {pid} was not launched here, or has already exited")
+    # an emulator that has exited, but is not yet reaped, keeps its process id
+    if _reaped(pid):
+        return
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + STOP_TIMEOUT
+    while not _reaped(pid):
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            _children.discard(pid)
+            return
+        time.sleep(0.01)
+
+
+class _LauncherHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            # a client may hold its connection open, so the server is not between requests
+            reap()
+            try:
+                request = json.loads(line)
+                if request["command"] == "launch":
+                    reply = {
+                        "pid": launch(request["arguments"], (self.server.socket, self.connection))
+                    }
+                elif request["command"] == "stop":
+                    stop(request["pid"])
+                    reply = {"pid": request["pid"]}
+                else:
+                    reply = {"error": f"Unknown command {request['command']!r}"}
+            except (KeyError, TypeError, ValueError, OSError, subprocess.SubprocessError) as error:
+                reply = {"error": str(error)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class LauncherServer(socketserver.TCPServer):
+    """
+    Serves launch and stop requests one connection at a time. It never starts a thread,
+    so it is always safe to fork. Emulators that exit by themselves are reaped while the
+    server waits and before each request, as socketserver.ForkingMixIn does.
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int]) -> None:
+        super().__init__(address, _LauncherHandler)
+
+    def service_actions(self) -> None:
+        reap()
+
+
+class LauncherClient:
+    """
+    Asks a launcher server for emulators.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 10.0) -> None:
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._socket.makefile("rwb")
+
+    def _request(self, request: dict) -> dict:
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        reply = json.loads(self._file.readline())
+        if "error" in reply:
+            raise RuntimeError(f"Launcher failed: {reply['error']}")
+        return reply
+
+    def launch(self, arguments: list) -> int:
+        """
+        @param arguments: (list) Lewis command line arguments, e.g. from lewis_arguments
+        @return: (int) process id of the emulator
+        """
+        return self._request({"command": "launch", "arguments": arguments})["pid"]
+
+    def stop(self, pid: int) -> None:
+        self._request({"command": "stop", "pid": pid})
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--control", default="127.0.0.1:57600", help="HOST:PORT to accept requests on"
+    )
+    arguments = parser.parse_args(argv)
+    host, _, port = arguments.control.rpartition(":")
+    prewarm()
+    with LauncherServer((host, int(port))) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import ast
+import mmap
+import sys
+from array import array
+
+# memoryview.cast formats for the supported sample types, keyed by numpy descr
+NPY_FORMATS = {
+    "<f8": "d",
+    "<f4": "f",
+    "<i4": "i",
+    "<i2": "h",
+    "<i8": "q",
+}
+NPY_MAGIC = b"\x93NUMPY"
+
+
+class PressureTrace:
+    """
+    Recorded cell and pump pressure samples, read lazily through a memory map.
+
+    A trace holds two columns, cell then pump pressure, sampled at a fixed interval.
+    Two file formats are accepted:
+     - NumPy ``.npy`` files with a C-ordered (N, 2) array of a little-endian
+       float64, float32, int64, int32 or int16 dtype
+     - flat binary files of interleaved cell/pump samples, with the sample type
+       given as a numpy-style descr (e.g. "<f8")
+
+    Only the pages holding the samples that are actually looked up are read from disk,
+    so multi-day captures can be replayed without loading them into memory.
+    """
+
+    def __init__(self, path: str, sample_interval: float = 1.0, dtype: str = "<f8") -> None:
+        """
+        @param path: (str) path to a .npy file or a flat binary file of interleaved samples
+        @param sample_interval: (float) time between consecutive samples in seconds
+        @param dtype: (str) sample type of a flat binary file, ignored for .npy files
+        """
+        if sample_interval <= 0:
+            raise ValueError(f"Sample interval must be positive, got {sample_interval}")
+        self.path = path
+        self.sample_interval = float(sample_interval)
+
+        with open(path, "rb") as trace_file:
+            if path.endswith(".npy"):
+                dtype, offset = self._read_npy_header(trace_file)
+            else:
+                offset = 0
+            if dtype not in NPY_FORMATS:
+                raise ValueError(f"Unsupported sample type {dtype} in {path}")
+            self._mmap = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data_length = len(self._mmap) - offset
+        item_size = int(dtype[2:])
+        usable = data_length - data_length % (2 * item_size)
+        self._samples = memoryview(self._mmap)[offset : offset + usable].cast(NPY_FORMATS[dtype])
+        self.length = len(self._samples) // 2
+        if self.length == 0:
+            self.close()
+            raise ValueError(f"Pressure trace {path} contains no samples")
+
+    @staticmethod
+    def _read_npy_header(trace_file: object) -> tuple[str, int]:
+        """
+        Parse the header of a version 1, 2 or 3 .npy file.
+        @return: (tuple) the dtype descr and the byte offset of the data
+        """
+        if trace_file.read(6) != NPY_MAGIC:
+            raise ValueError(f"{trace_file.name} is not a .npy file")
+        major_version = trace_file.read(2)[0]
+        length_size = 2 if major_version == 1 else 4
+        header_length = int.from_bytes(trace_file.read(length_size), "little")
+        header = ast.literal_eval(trace_file.read(header_length).decode("latin1"))
+        if header["fortran_order"]:
+            raise ValueError(f"{trace_file.name} must be C ordered")
+        shape = header["shape"]
+        if len(shape) != 2 or shape[1] != 2:
+            raise ValueError(f"{trace_file.name} must have shape (N, 2), got {shape}")
+        return header["descr"], 6 + 2 + length_size + header_length
+
+    @property
+    def duration(self) -> float:
+        return self.length * self.sample_interval
+
+    def sample_at(self, time: float, loop: bool = False) -> tuple[float, float]:
+        """
+        Get the sample covering a simulated time.
+        Times past the end of the trace hold the last sample unless looping.
+        @param time: (float) seconds since the start of the trace
+        @param loop: (bool) wrap around to the start of the trace once it is exhausted
+        @return: (tuple) cell and pump pressure
+        """
+        index = int(time / self.sample_interval)
+        if index < 0:
+            index = 0
+        elif index >= self.length:
+            index = index % self.length if loop else self.length - 1
+        return self._samples[2 * index], self._samples[2 * index + 1]
+
+    def close(self) -> None:
+        self._samples.release()
+        self._mmap.close()
+
+
+def write_pressure_trace(path: str, samples: list[tuple[float, float]]) -> None:
+    """
+    Write (cell, pump) samples as a flat float64 trace, e.g. to build test fixtures.
+    @param path: (str) file to write
+    @param samples: (list) cell and pump pressure pairs
+    """
+    values = array("d", (value for sample in samples for value in sample))
+    if sys.byteorder != "little":
+        values.byteswap()
+    with open(path, "wb") as trace_file:
+        values.tofile(trace_file)
@@ -0,0 +1,40 @@
+from collections import deque
+
+# Simulated seconds over which a pressure drop counts as sudden
+SEAL_FAIL_WINDOW = 10.0
+
+
+class SealFailDetector:
+    """
+    Measures how far the pressure has dropped below its maximum over a sliding window of
+    simulated time.
+
+    The window's samples are kept in a deque of strictly decreasing pressure, so its maximum
+    is always at the front. Each sample is added and removed at most once, so a sample costs
+    O(1) however fast simulated time runs.
+    """
+
+    def __init__(self, window: float = SEAL_FAIL_WINDOW) -> None:
+        """
+        @param window: (float) length of the window in simulated seconds
+        """
+        self.window = window
+        self._samples = deque()
+
+    def clear(self) -> None:
+        self._samples.clear()
+
+    def drop(self, time: float, pressure: float) -> float:
+        """
+        Add a sample to the window.
+        @param time: (float) simulated time of the sample in seconds
+        @param pressure: (float) pressure at that time
+        @return: (float) the window's maximum pressure less this pressure
+        """
+        samples = self._samples
+        while samples and samples[-1][1] <= pressure:
+            samples.pop()
+        samples.append((time, pressure))
+        while samples[0][0] < time - self.window:
+            samples.popleft()
+        return samples[0][1] - pressure
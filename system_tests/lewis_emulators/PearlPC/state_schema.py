@@ -0,0 +1,137 @@
+from operator import attrgetter
+from typing import NamedTuple
+
+
+class StateField(NamedTuple):
+    """
+    One scalar of the emulated controller's state.
+    """
+
+    name: str
+    type: type
+    # power-on value, which may be outside the range, e.g. 0 for a setpoint not yet sent
+    default: object
+    minimum: int | None = None
+    maximum: int | None = None
+    # index of the value in the status report, after the header line
+    status_position: int | None = None
+
+
+# The emulator's scalar state. Ranges are those the controller accepts over the serial
+# line; the Lewis backdoor sets attributes directly, so tests can still force other values.
+# Ranges only apply to values set by requests: several fields power on at 0, below their
+# minimum, meaning not yet set (and for seal_fail_value, seal fail detection off).
+STATE_SCHEMA = (
+    StateField("connected", bool, True),
+    # simulated seconds since start, advanced by the state machine cycle
+    StateField("simulation_time", float, 0.0),
+    StateField("pressure_trace_start", float, 0.0),
+    StateField("pressure_trace_loop", bool, False),
+    StateField("initial_id_prefix", int, 1111, 0, 9999),
+    # "Oil" or "Pentane", set manually on the machine by the inst scientist
+    StateField("fluid_type", str, "Pentane"),
+    StateField("secondary_id_prefix", int, 1111, 0, 9999),
+    StateField("em_stop_status", int, 0, 0, 1, 0),
+    StateField("run_bit", int, 0, 0, 1, 1),
+    StateField("reset_value", int, 0, 0, 4, 2),
+    StateField("piston_reset_phase", int, 0, 0, 4),
+    StateField("stop_bit", int, 0, 0, 1, 3),
+    StateField("busy_bit", int, 0, 0, 1, 4),
+    StateField("go_status", int, 0, 0, 1, 5),
+    # auto mode (run from host) rather than manual
+    StateField("am_mode", int, 1, 0, 1, 6),
+    StateField("loop_mode", int, 0, 0, 1, 7),
+    # set to 1 if sudden pressure drop more than seal_fail_value
+    StateField("seal_fail_status", int, 0, 0, 1, 8),
+    StateField("last_error_code", int, 0, 0, 19, 9),
+    # 0 selects the maximum slew rate of the motor
+    StateField("pressure_rate", int, 0, 0, 40, 10),
+    StateField("min_value_pre_servoing", int, 0, 1, 9999, 11),
+    StateField("setpoint_value", int, 0, 1, 1000, 12),
+    StateField("max_value_pre_servoing", int, 0, 1, 9999, 13),
+    StateField("seal_fail_value", int, 0, 1, 999),
+    # a 9 digit number like 111111001 showing input status
+    StateField("inputs", int, 0),
+    StateField("cell_pressure", int, 0),  # cell transducer reading
+    StateField("pump_pressure", int, 0),  # pump transducer reading
+    # pressure the transducers measure, moved by the servo
+    StateField("true_pressure", int, 0),
+    StateField("transducer_difference_threshold", int, 2, 1, 999),
+    StateField("algorithm", str, "a"),
+    # last t command argument, e.g. 1020502, or 0 before one is sent
+    StateField("transducer", int, 0, 1000000, 2999999),
+    StateField("user_stop_limit", int, 1000, 0, 9999),
+    StateField("offset_plus", int, 0, 0, 9),
+    StateField("offset_minus", int, 0, 0, 9),
+    StateField("dir_plus", int, 0, 0, 9999),
+    StateField("dir_minus", int, 0, 0, 9999),
+    # for comms with poller thread
+    StateField("run_requested", int, 0, 0, 1),
+    StateField("stop_requested", int, 0, 0, 1),
+    StateField("reset_requested", int, 0, 0, 1),
+    StateField("purge_requested", int, 0, 0, 1),
+    # ramping to setpoint as opposed to closed loop stabilisation?
+    StateField("ramping", int, 0, 0, 1),
+)
+
+STATE_FIELDS = {field.name: field for field in STATE_SCHEMA}
+
+# Fields reported by st before the pressure and inputs, in report order
+STATUS_REPORT_FIELDS = tuple(
+    field.name
+    for field in sorted(
+        (field for field in STATE_SCHEMA if field.status_position is not None),
+        key=lambda field: field.status_position,
+    )
+)
+
+
+_get_status_values = attrgetter(*STATUS_REPORT_FIELDS)
+
+
+def render_status_values(state: object) -> str:
+    """
+    @param state: (object) object holding the state
+    @return: (str) the values reported by st before the pressure, separated by spaces
+    """
+    return " ".join(map(str, _get_status_values(state)))
+
+
+def state_slots(*extra: str) -> tuple[str, ...]:
+    """
+    @param extra: (str) names of other attributes to give slots
+    @return: (tuple) __slots__ for a class holding the state
+    """
+    return tuple(field.name for field in STATE_SCHEMA) + extra
+
+
+def initialise_state(target: object) -> None:
+    """
+    Set every field of the state to its default.
+    @param target: (object) object holding the state
+    """
+    for field in STATE_SCHEMA:
+        setattr(target, field.name, field.default)
+
+
+def validate(name: str, value: object) -> object:
+    """
+    Convert a value to its field's type and check it is in the field's range. Defaults are
+    not checked against the ranges, so a field's default need not pass.
+    @param name: (str) name of the field
+    @param value: (object) value to check, e.g. the digits of a request
+    @return: (object) the value as the field's type
+    @raise ValueError: if the value is not of the field's type or is out of its range
+    """
+    field = STATE_FIELDS[name]
+    if field.type is int and isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{name} must be a whole number, got {value!r}")
+    try:
+        converted = field.type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {field.type.__name__}, got {value!r}") from None
+    if field.minimum is not None and converted < field.minimum:
+        raise ValueError(f"{name} must be at least {field.minimum}, got {converted}")
+    if field.maximum is not None and converted > field.maximum:
+        raise ValueError(f"{name} must be at most {field.maximum}, got {converted}")
+    return converted
@@ -2,4 +2,5 @@ from lewis.core.statemachine import State
 
 
 class DefaultState(State):
-    pass
+    def in_state(self, dt: float) -> None:
+        self._context.advance_time(dt)
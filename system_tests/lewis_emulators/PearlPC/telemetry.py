@@ -0,0 +1,271 @@
+"""
+Columnar telemetry of emulator runs.
+
+A telemetry file records one row per simulation step, so a failing soak or CI run can be
+replayed and analysed afterwards without verbose logging slowing the run down:
+
+    python -m system_tests.lewis_emulators.PearlPC.telemetry run.tlm --start 1000 --stop 1100
+
+The file is append-only. After a header naming the columns, it holds chunks of up to
+CHUNK_ROWS rows, each a chunk header followed by every column's values in turn:
+
+    header  MAGIC, header length (uint32), JSON list of [column name, array typecode]
+    chunk   CHUNK_MAGIC, row count (uint32), then each column's values, little-endian
+
+Every part is padded to a multiple of 8 bytes so the values are aligned for reading in
+place. A chunk cut short by a crash is ignored by the reader.
+"""
+
+import argparse
+import json
+import mmap
+import queue
+import struct
+import sys
+import threading
+from array import array
+
+MAGIC = b"PEARLTLM"
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sI")
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 8
+
+# name and array typecode of each column, widest first to keep the values aligned
+COLUMNS = (
+    ("time", "d"),  # simulated seconds
+    ("cell_pressure", "d"),
+    ("pump_pressure", "d"),
+    ("pressure", "i"),  # computed by the selected algorithm
+    ("setpoint", "i"),
+    ("run", "B"),
+    ("stop", "B"),
+    ("busy", "B"),
+    ("reset_phase", "B"),
+    ("error_code", "B"),
+)
+CHUNK_ROWS = 4096
+# full chunks waiting for the flusher; recording waits for it rather than queue more
+MAX_QUEUED_CHUNKS = 4
+
+
+def _padding(length: int) -> bytes:
+    return bytes(-length % ALIGNMENT)
+
+
+class TelemetryRecorder:
+    """
+    Appends rows to a telemetry file. Rows are collected in per-column arrays and each full
+    chunk is handed to a background thread to write, so recording a step costs a few
+    appends. At most MAX_QUEUED_CHUNKS chunks wait to be written, which bounds the memory
+    used however long the run.
+    """
+
+    def __init__(
+        self, path: str, chunk_rows: int = CHUNK_ROWS, max_queued_chunks: int = MAX_QUEUED_CHUNKS
+    ) -> None:
+        """
+        @param path: (str) file to write, replaced if it exists
+        @param chunk_rows: (int) rows per chunk
+        @param max_queued_chunks: (int) full chunks that may wait to be written
+        """
+        if chunk_rows < 1:
+            raise ValueError(f"Chunk rows must be at least 1, got {chunk_rows}")
+        self.path = path
+        self.rows = 0
+        self._chunk_rows = chunk_rows
+        self._columns = self._new_columns()
+        self._queue = queue.Queue(maxsize=max_queued_chunks)
+        self._error = None
+        self._file = open(path, "wb")  # noqa: SIM115 - held open while recording, closed by close()
+        header = json.dumps(COLUMNS).encode()
+        header += _padding(len(MAGIC) + HEADER_LENGTH.size + len(header))
+        self._file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        self._flusher = threading.Thread(
+            target=self._flush_chunks, name="telemetry flusher", daemon=True
+        )
+        self._flusher.start()
+
+    @staticmethod
+    def _new_columns() -> list[array]:
+        return [array(typecode) for _, typecode in COLUMNS]
+
+    def record(self, *values: float) -> None:
+        """
+        Add a row. It is written once its chunk is full, or when the recorder is closed.
+        A row that does not fit the columns is not added, so the columns stay in step.
+        @param values: (float) a value for each of COLUMNS, in order
+        @raise ValueError: if there is not one value per column, or a value does not fit
+        its column's type
+        """
+        if self._error is not None:
+            raise RuntimeError(f"Writing telemetry to {self.path} failed") from self._error
+        if len(values) != len(self._columns):
+            raise ValueError(f"Expected {len(self._columns)} values, got {len(values)}")
+        appended = 0
+        try:
+            for column, value in zip(self._columns, values):
+                column.append(value)
+                appended += 1
+        except (OverflowError, TypeError) as error:
+            for column in self._columns[:appended]:
+                column.pop()
+            name = COLUMNS[appended][0]
+            raise ValueError(f"Cannot record {values[appended]!r} as {name}") from error
+        self.rows += 1
+        if len(self._columns[0]) >= self._chunk_rows:
+            self._queue.put(self._columns)
+            self._columns = self._new_columns()
+
+    def _flush_chunks(self) -> None:
+        while True:
+            columns = self._queue.get()
+            if columns is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(columns[0])))
+                for column in columns:
+                    if sys.byteorder != "little":
+                        column.byteswap()
+                    data = column.tobytes()
+                    self._file.write(data + _padding(len(data)))
+                # readers of a live file see whole chunks
+                self._file.flush()
+            except OSError as error:
+                self._error = error
+
+    def close(self) -> None:
+        """
+        Write the rows still held and close the file.
+        """
+        if self._file.closed:
+            return
+        if len(self._columns[0]):
+            self._queue.put(self._columns)
+            self._columns = self._new_columns()
+        self._queue.put(None)
+        self._flusher.join()
+        try:
+            self._file.close()
+        except OSError as error:
+            # writing out the header, if no chunk has been written yet
+            self._error = self._error or error
+        if self._error is not None:
+            raise RuntimeError(f"Writing telemetry to {self.path} failed") from self._error
+
+
+class TelemetryReader:
+    """
+    Reads a telemetry file through a memory map, so only the chunks holding the rows asked
+    for are read from disk. Rows written after the reader was opened are not seen.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        @param path: (str) telemetry file, possibly still being recorded
+        """
+        self.path = path
+        with open(path, "rb") as telemetry_file:
+            self._mmap = mmap.mmap(telemetry_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            self.columns, offset = self._read_header()
+            self._chunks = self._index_chunks(offset)
+        except ValueError:
+            self.close()
+            raise
+        self.length = sum(rows for _, rows, _ in self._chunks)
+
+    def _read_header(self) -> tuple[dict[str, str], int]:
+        """
+        @return: (tuple) typecode of each column by name, and the offset of the first chunk
+        """
+        if self._view[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a telemetry file")
+        (header_length,) = HEADER_LENGTH.unpack_from(self._view, len(MAGIC))
+        offset = len(MAGIC) + HEADER_LENGTH.size
+        columns = json.loads(bytes(self._view[offset : offset + header_length]))
+        return dict(columns), offset + header_length
+
+    def _index_chunks(self, offset: int) -> list[tuple[int, int, int]]:
+        """
+        @return: (list) first row, row count and data offset of each complete chunk
+        """
+        chunks = []
+        first_row = 0
+        row_size = [array(typecode).itemsize for typecode in self.columns.values()]
+        while offset + CHUNK_HEADER.size <= len(self._view):
+            magic, rows = CHUNK_HEADER.unpack_from(self._view, offset)
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"{self.path} has a corrupt chunk at byte {offset}")
+            data_offset = offset + CHUNK_HEADER.size
+            end = data_offset + sum(size * rows + len(_padding(size * rows)) for size in row_size)
+            if end > len(self._view):
+                break
+            chunks.append((first_row, rows, data_offset))
+            first_row += rows
+            offset = end
+        return chunks
+
+    def read(
+        self, start: int = 0, stop: int | None = None, columns: list[str] | None = None
+    ) -> dict[str, array]:
+        """
+        Load a slice of rows.
+        @param start: (int) first row
+        @param stop: (int) row to stop before, or None for the end of the file
+        @param columns: (list) names of the columns to load, or None for all of them
+        @return: (dict) the values of each column, by name
+        @raise ValueError: if start is negative or a column is not in the file
+        """
+        if start < 0:
+            raise ValueError(f"Start row must not be negative, got {start}")
+        stop = self.length if stop is None else min(stop, self.length)
+        names = list(self.columns) if columns is None else columns
+        for name in names:
+            if name not in self.columns:
+                raise ValueError(f"{self.path} has no column {name!r}")
+        values = {name: array(self.columns[name]) for name in names}
+        for first_row, rows, offset in self._chunks:
+            if first_row + rows <= start:
+                continue
+            if first_row >= stop:
+                break
+            begin = max(start, first_row) - first_row
+            end = min(stop, first_row + rows) - first_row
+            for name, typecode in self.columns.items():
+                size = array(typecode).itemsize * rows
+                if name in values:
+                    column = self._view[offset : offset + size].cast(typecode)
+                    values[name].extend(column[begin:end])
+                    column.release()
+                offset += size + len(_padding(size))
+        return values
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="Telemetry file")
+    parser.add_argument("--start", type=int, default=0, help="First row to print")
+    parser.add_argument("--stop", type=int, help="Row to stop before")
+    parser.add_argument("--columns", nargs="+", help="Columns to print, default all")
+    arguments = parser.parse_args(argv)
+
+    reader = TelemetryReader(arguments.path)
+    try:
+        values = reader.read(arguments.start, arguments.stop, arguments.columns)
+    finally:
+        reader.close()
+    print(",".join(values))
+    for row in zip(*values.values()):
+        print(",".join(str(value) for value in row))
+
+
+if __name__ == "__main__":
+    main()
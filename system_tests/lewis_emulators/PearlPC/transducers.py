@@ -0,0 +1,108 @@
+import random
+from collections.abc import Callable
+
+# Normal samples generated at a time; one block covers minutes of both transducers at the
+# default cycle rate, so block generation cost is spread over thousands of readings
+NOISE_BLOCK_SIZE = 4096
+
+# Emulator interpretation of the t command's noise and drift digits
+NOISE_CLASSES = {1: 0.0, 2: 0.5, 3: 2.0}  # standard deviation in bar
+DRIFT_CLASSES = {1: 0.0, 2: 0.1, 3: 1.0}  # bar/min
+
+
+def _normal_generator(seed: int | None) -> Callable[[int], list[float]]:
+    """
+    @param seed: (int) seed for reproducible noise, or None
+    @return: (callable) function returning a block of the given number of unit normal samples
+    """
+    try:
+        import numpy
+    except ImportError:
+        rng = random.Random(seed)
+        return lambda size: [rng.gauss(0.0, 1.0) for _ in range(size)]
+    numpy_rng = numpy.random.default_rng(seed)
+    return lambda size: numpy_rng.standard_normal(size).tolist()
+
+
+class NoiseSource:
+    """
+    Unit normal samples handed out one at a time from pre-generated blocks.
+
+    Blocks come from NumPy when it is installed, so each reading costs a list index rather
+    than a call into the random module. NumPy is only imported when the first block is
+    needed, so emulators without noise do not pay for the import.
+    """
+
+    def __init__(self, seed: int | None = None, block_size: int = NOISE_BLOCK_SIZE) -> None:
+        self.seed = seed
+        self.block_size = block_size
+        self._generator = None
+        self._block = []
+        self._index = 0
+
+    def next(self) -> float:
+        if self._index >= len(self._block):
+            if self._generator is None:
+                self._generator = _normal_generator(self.seed)
+            self._block = self._generator(self.block_size)
+            self._index = 0
+        value = self._block[self._index]
+        self._index += 1
+        return value
+
+
+class TransducerModel:
+    """
+    Errors of one pressure transducer: a fixed offset, drift accumulating at a constant
+    rate until the transducer is reset, and gaussian noise on every reading.
+    """
+
+    def __init__(self, noise: float = 0.0, offset: float = 0.0, drift_rate: float = 0.0) -> None:
+        """
+        @param noise: (float) standard deviation of the reading noise in bar
+        @param offset: (float) fixed offset of the reading in bar
+        @param drift_rate: (float) drift of the reading in bar/min
+        """
+        self.noise = noise
+        self.offset = offset
+        self.drift_rate = drift_rate
+        self.drift = 0.0
+
+    @property
+    def is_active(self) -> bool:
+        return bool(self.noise or self.offset or self.drift_rate or self.drift)
+
+    def advance(self, dt: float) -> None:
+        """
+        @param dt: (float) elapsed simulated time in seconds
+        """
+        self.drift += self.drift_rate * dt / 60.0
+
+    def zero(self) -> None:
+        self.drift = 0.0
+
+    def measure(self, pressure: float, noise_source: NoiseSource) -> int:
+        """
+        @param pressure: (float) true pressure at the transducer
+        @param noise_source: (NoiseSource) source of the reading noise
+        @return: (int) reading in whole bar, as the controller reports it
+        """
+        reading = pressure + self.offset + self.drift
+        if self.noise:
+            reading += self.noise * noise_source.next()
+        return round(reading)
+
+
+def parse_transducer_setting(setting: str) -> tuple[int, float, float, float]:
+    """
+    Interpret the argument of the t command. The controller's meaning of the digits is not
+    emulated; instead a setting such as "1020502" is read as transducer 1 (cell) or
+    2 (pump), 0, noise class 1-3, offset 00-99 bar, 0, drift class 1-3.
+    @param setting: (str) seven digit argument of the t command
+    @return: (tuple) transducer, noise in bar, offset in bar and drift rate in bar/min
+    """
+    transducer = int(setting[0])
+    noise = NOISE_CLASSES[int(setting[2])]
+    offset = float(setting[3:5])
+    drift_rate = DRIFT_CLASSES[int(setting[6])]
+    return transducer, noise, offset, drift_rate
@@ -0,0 +1,2 @@
+# Performance tooling for the PearlPC emulator, run from the repository root, e.g.
+#   python -m system_tests.performance.session replay session.jsonl
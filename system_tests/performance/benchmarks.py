@@ -0,0 +1,305 @@
+"""
+Benchmarks for the PearlPC emulator and its protocol hot paths.
+
+In-process cases time the device and interface methods directly. TCP cases run full
+request to reply round-trips against the emulator under Lewis (launched in a subprocess
+unless --address is given) at increasing numbers of concurrent clients.
+
+    python -m system_tests.performance.benchmarks --output results.json
+    python -m system_tests.performance.benchmarks --update-baseline
+    python -m system_tests.performance.benchmarks --compare
+
+Every result is a single lower-is-better value; --compare fails if any result is slower
+than the stored baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+
+from system_tests.performance.emulator import create_emulator, launch_emulator, quiet
+from system_tests.performance.stats import summarise_latencies
+from system_tests.performance.transport import IOC_POLL_REQUESTS, LineClient, parse_address
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+
+ALGORITHMS = ("a", "1", "2", "h", "l", "w25")
+MEMORY_ADDRESSES = (2, 81, 82, 83, 84, 85, 87, 88, 126, 500)
+CLIENT_COUNTS = (1, 2, 4, 8, 16)
+
+# A representative request for every command in PearlPCStreamInterface.commands
+COMMAND_REQUESTS = {
+    "get_st": "st",
+    "get_id": "id",
+    "set_si": "si1111",
+    "set_sd": "sd1111",
+    "set_sloop": "sloop1",
+    "set_sf": "sf0010",
+    "error_reset": "er",
+    "set_ra": "ra0010",
+    "set_mn": "mn0010",
+    "set_sp": "sp0050",
+    "set_mx": "mx0100",
+    "reset": "reset",
+    "purge": "pu",
+    "run": "run",
+    "stop": "stop",
+    "set_t": "t1010101",
+    "set_th": "th0050",
+    "transducer_reset": "tr",
+    "set_algorithm": "aa",
+    "get_dt": "dt",
+    "set_user_stop_limit": "ul1000",
+    "show_limits": "ls",
+    "get_memory": "vr0087",
+    "set_pos_lim": "d+0020",
+    "set_neg_lim": "d-0020",
+    "set_pos_offset": "o+1",
+    "set_neg_offset": "o-1",
+}
+
+
+def time_case(func: Callable[[], object], repeat: int = 5, min_time: float = 0.1) -> dict:
+    """
+    Time a callable, calibrating the loop count so that each repeat takes at least min_time.
+    @return: (dict) median and best time per call in nanoseconds
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 10 if elapsed < min_time * 1e8 else 2
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter_ns() - start) / loops)
+    return {"value": statistics.median(timings), "unit": "ns/op", "best": min(timings)}
+
+
+def running_emulator() -> object:
+    """
+    @return: (PearlPCStreamInterface) an emulator ramping between two setpoints
+    """
+    interface = create_emulator()
+    device = interface.device
+    device.pressure_rate = 10
+    device.user_stop_limit = 1000
+    device.setpoint_value = 500
+    device.run()
+    device.poller()
+    return interface
+
+
+def in_process_cases() -> Iterator[tuple[str, Callable[[], object]]]:
+    interface = create_emulator()
+    device = interface.device
+    yield "get_st", interface.get_st
+
+    for algorithm in ALGORITHMS:
+        algorithm_device = create_emulator().device
+        algorithm_device.algorithm = algorithm
+        algorithm_device.set_pressures(100, 110)
+        yield f"get_pressure[{algorithm}]", algorithm_device.get_pressure
+
+    for address in MEMORY_ADDRESSES:
+        yield f"get_memory[{address}]", lambda address=address: interface.get_memory(address)
+
+    ramping = running_emulator()
+
+    def step_ramp() -> None:
+        ramping_device = ramping.device
+        if ramping_device.run_bit == 0:
+            ramping_device.setpoint_value = 1000 - ramping_device.setpoint_value
+            ramping_device.run()
+        ramping_device.poller()
+
+    yield "poller[idle]", device.poller
+    yield "poller[ramping]", step_ramp
+    yield "running", running_emulator().device.running
+    yield "process[cycle]", lambda: device.process(0.1)
+
+    for command, request in COMMAND_REQUESTS.items():
+        yield f"dispatch[{command}]", lambda request=request: interface.process_request(request)
+
+
+def check_command_coverage() -> None:
+    from system_tests.lewis_emulators.PearlPC.interfaces import PearlPCStreamInterface
+
+    commands = {cmd.func for cmd in PearlPCStreamInterface.commands}
+    missing = commands - COMMAND_REQUESTS.keys()
+    if missing:
+        raise RuntimeError(f"No benchmark request for commands: {', '.join(sorted(missing))}")
+
+
+def round_trips(address: tuple[str, int], clients: int, cycles: int) -> dict:
+    """
+    Run the IOC's polling requests from several concurrent clients.
+    @param address: (tuple) host and port of the emulator
+    @param clients: (int) number of concurrent connections
+    @param cycles: (int) passes over the polling requests per client
+    @return: (dict) median latency as the value, with throughput and latency percentiles
+    """
+    connections = [LineClient(*address) for _ in range(clients)]
+    latencies = [[] for _ in range(clients)]
+    timeouts = [0] * clients
+    barrier = threading.Barrier(clients + 1)
+
+    def client_loop(index: int) -> None:
+        connection = connections[index]
+        barrier.wait()
+        for _ in range(cycles):
+            for request in IOC_POLL_REQUESTS:
+                sent = time.perf_counter()
+                if connection.request(request) is None:
+                    timeouts[index] += 1
+                latencies[index].append(time.perf_counter() - sent)
+
+    threads = [threading.Thread(target=client_loop, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for connection in connections:
+        connection.close()
+
+    all_latencies = [latency for client in latencies for latency in client]
+    summary = summarise_latencies(all_latencies)
+    return {
+        "value": summary["p50_ms"],
+        "unit": "ms p50",
+        "p99_ms": summary["p99_ms"],
+        "throughput_per_s": len(all_latencies) / elapsed,
+        "timeouts": sum(timeouts),
+    }
+
+
+def run_benchmarks(
+    address: tuple[str, int] | None,
+    in_process: bool,
+    tcp: bool,
+    cycles: int,
+    pattern: str,
+    protocol: str = "stream",
+) -> dict:
+    results = {}
+    if in_process:
+        check_command_coverage()
+        with quiet():
+            for name, func in in_process_cases():
+                if pattern in name:
+                    results[name] = time_case(func)
+                    print(f"{name:32} {results[name]['value']:12.0f} ns/op", file=sys.stderr)
+    if tcp:
+        if address is None:
+            with launch_emulator(protocol) as launched:
+                results.update(tcp_cases(launched, cycles, pattern))
+        else:
+            results.update(tcp_cases(address, cycles, pattern))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "protocol": protocol,
+        },
+        "results": results,
+    }
+
+
+def tcp_cases(address: tuple[str, int], cycles: int, pattern: str) -> dict:
+    results = {}
+    for clients in CLIENT_COUNTS:
+        name = f"round_trip[{clients} clients]"
+        if pattern in name:
+            results[name] = round_trips(address, clients, cycles)
+            print(
+                f"{name:32} {results[name]['value']:9.3f} ms p50 "
+                f"{results[name]['throughput_per_s']:9.0f} req/s",
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    @return: (list) descriptions of results slower than the baseline by more than tolerance
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        ratio = result["value"] / reference["value"] if reference["value"] else 1.0
+        if ratio > 1.0 + tolerance:
+            regressions.append(
+                f"{name}: {result['value']:.3f} {result['unit']} vs baseline "
+                f"{reference['value']:.3f} ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--address", help="HOST:PORT of a running emulator for TCP cases")
+    parser.add_argument("--no-tcp", action="store_true", help="Only run in-process cases")
+    parser.add_argument("--no-in-process", action="store_true", help="Only run TCP cases")
+    parser.add_argument(
+        "--protocol",
+        choices=["stream", "stream_asyncio"],
+        default="stream",
+        help="Lewis protocol of the launched emulator for TCP cases",
+    )
+    parser.add_argument("--cycles", type=int, default=50, help="Polling passes per TCP client")
+    parser.add_argument("--filter", default="", help="Only run cases containing this text")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store results as baseline")
+    parser.add_argument("--compare", action="store_true", help="Fail on regression vs baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    arguments = parser.parse_args(argv)
+
+    address = parse_address(arguments.address) if arguments.address else None
+    results = run_benchmarks(
+        address,
+        not arguments.no_in_process,
+        not arguments.no_tcp,
+        arguments.cycles,
+        arguments.filter,
+        arguments.protocol,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if arguments.update_baseline:
+        with open(arguments.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if arguments.compare:
+        if not os.path.exists(arguments.baseline):
+            print(f"No baseline at {arguments.baseline}, run with --update-baseline first")
+            return 1
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Iterator
+
+from system_tests.lewis_emulators.PearlPC import SimulatedPearlPC
+from system_tests.lewis_emulators.PearlPC.interfaces import PearlPCStreamInterface
+
+SYSTEM_TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# how long to wait for a launched Lewis process to start listening
+LAUNCH_TIMEOUT = 30.0
+
+
+def create_emulator() -> PearlPCStreamInterface:
+    """
+    Create an in-process emulator: a new device bound to a stream interface,
+    without any Lewis simulation or network adapter around it.
+    @return: (PearlPCStreamInterface) interface bound to a fresh SimulatedPearlPC
+    """
+    interface = PearlPCStreamInterface()
+    interface.device = SimulatedPearlPC()
+    return interface
+
+
+@contextlib.contextmanager
+def quiet() -> Iterator[None]:
+    """
+    Silence the emulator's diagnostic prints, which would otherwise dominate any timing.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@contextlib.contextmanager
+def launch_emulator(
+    protocol: str = "stream", port: int | None = None, control_port: int | None = None
+) -> Iterator[tuple[str, int]]:
+    """
+    Run the emulator under Lewis in a subprocess, as the IOC test framework does.
+    @param protocol: (str) Lewis protocol to expose the emulator on
+    @param port: (int) port to listen on, or None to pick a free one
+    @param control_port: (int) port for the Lewis control server (the backdoor), or None
+    for no control server
+    @return: (tuple) host and port the emulator listens on
+    """
+    port = port or free_port()
+    command = [
+        sys.executable,
+        "-m",
+        "lewis",
+        "-a",
+        SYSTEM_TESTS_DIR,
+        "-k",
+        "lewis_emulators",
+        "PearlPC",
+        "-p",
+        f"{protocol}: {{bind_address: 127.0.0.1, port: {port}}}",
+    ]
+    if control_port is not None:
+        command += ["-r", f"127.0.0.1:{control_port}"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + LAUNCH_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Lewis exited with code {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Emulator did not listen on port {port}")
+                time.sleep(0.05)
+        yield "127.0.0.1", port
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
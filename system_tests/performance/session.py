@@ -0,0 +1,277 @@
+"""
+Capture IOC to controller sessions and replay them against the emulator.
+
+A session file is JSON lines: a header object followed by one object per exchange,
+    {"t": 12.003, "request": "vr0087", "reply": "vr0087 25\\r\\n"}
+where t is seconds since the first request and reply is everything the controller sent
+back before the next request (null if nothing was sent).
+
+Record by pointing the IOC at a recording proxy in front of the controller:
+    python -m system_tests.performance.session record --listen 127.0.0.1:4001 \\
+        --upstream ndxpearl-ts:4001 pearl.jsonl
+Replay in-process, or against a running emulator with --address:
+    python -m system_tests.performance.session replay pearl.jsonl --timing original
+"""
+
+import argparse
+import contextlib
+import json
+import socket
+import sys
+import threading
+import time
+from typing import NamedTuple, TextIO
+
+from system_tests.performance.stats import summarise_latencies
+from system_tests.performance.transport import IN_TERMINATOR, LineClient, parse_address
+
+SESSION_FORMAT = "pearlpc-session"
+SESSION_VERSION = 1
+# number of differing replies included in a replay report
+MISMATCH_EXAMPLES = 10
+
+
+class Exchange(NamedTuple):
+    time: float
+    request: str
+    reply: str | None
+
+
+def write_header(session_file: TextIO, source: str) -> None:
+    header = {"format": SESSION_FORMAT, "version": SESSION_VERSION, "source": source}
+    session_file.write(json.dumps(header) + "\n")
+
+
+def write_exchange(session_file: TextIO, exchange: Exchange) -> None:
+    record = {"t": round(exchange.time, 6), "request": exchange.request, "reply": exchange.reply}
+    session_file.write(json.dumps(record) + "\n")
+
+
+def read_session(path: str) -> list[Exchange]:
+    """
+    @param path: (str) session file
+    @return: (list) the recorded exchanges in order
+    """
+    with open(path) as session_file:
+        header = json.loads(session_file.readline())
+        if header.get("format") != SESSION_FORMAT or header.get("version") != SESSION_VERSION:
+            raise ValueError(f"{path} is not a version {SESSION_VERSION} PearlPC session")
+        exchanges = []
+        for line in session_file:
+            if line.strip():
+                record = json.loads(line)
+                exchanges.append(Exchange(record["t"], record["request"], record["reply"]))
+    return exchanges
+
+
+class SessionRecorder:
+    """
+    Pairs requests seen on the host side with the bytes the controller sends back,
+    writing each exchange once the next request starts or the session ends.
+    """
+
+    def __init__(self, session_file: TextIO) -> None:
+        self._session_file = session_file
+        self._lock = threading.Lock()
+        self._start = None
+        self._request = None
+        self._request_time = 0.0
+        self._reply = b""
+        self._partial_request = b""
+
+    def host_data(self, data: bytes) -> None:
+        with self._lock:
+            self._partial_request += data
+            *requests, self._partial_request = self._partial_request.split(IN_TERMINATOR.encode())
+            for request in requests:
+                now = time.monotonic()
+                if self._start is None:
+                    self._start = now
+                self._flush()
+                self._request = request.decode(errors="replace")
+                self._request_time = now - self._start
+
+    def controller_data(self, data: bytes) -> None:
+        with self._lock:
+            self._reply += data
+
+    def finish(self) -> None:
+        with self._lock:
+            self._flush()
+            self._session_file.flush()
+
+    def _flush(self) -> None:
+        if self._request is not None:
+            reply = self._reply.decode(errors="replace") if self._reply else None
+            write_exchange(self._session_file, Exchange(self._request_time, self._request, reply))
+        self._request = None
+        self._reply = b""
+
+
+def _pump(source: socket.socket, destination: socket.socket, observe: object) -> None:
+    try:
+        while data := source.recv(4096):
+            observe(data)
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (source, destination):
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+
+
+def record(listen: tuple[str, int], upstream: tuple[str, int], path: str) -> None:
+    """
+    Proxy one host connection to the controller, recording the session until either side
+    disconnects.
+    @param listen: (tuple) address the host (IOC) connects to
+    @param upstream: (tuple) address of the controller or terminal server port
+    @param path: (str) session file to write
+    """
+    with socket.create_server(listen) as server, open(path, "w") as session_file:
+        print(f"Waiting for the host on {listen[0]}:{listen[1]}")
+        host, _ = server.accept()
+        controller = socket.create_connection(upstream)
+        write_header(session_file, f"{upstream[0]}:{upstream[1]}")
+        recorder = SessionRecorder(session_file)
+        replies = threading.Thread(
+            target=_pump, args=(controller, host, recorder.controller_data), daemon=True
+        )
+        replies.start()
+        try:
+            _pump(host, controller, recorder.host_data)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            host.close()
+            controller.close()
+            replies.join(timeout=1.0)
+            recorder.finish()
+
+
+def replay(
+    exchanges: list[Exchange],
+    address: tuple[str, int] | None = None,
+    timing: str = "fast",
+    speed: float = 1.0,
+) -> dict[str, object]:
+    """
+    Replay the host side of a session and compare the replies with the recording.
+    In-process, the emulator's simulated time follows the recorded timestamps whatever
+    the replay timing, so device behaviour does not depend on how fast the replay runs.
+    @param exchanges: (list) recorded exchanges
+    @param address: (tuple) host and port of a running emulator, or None to replay in-process
+    @param timing: (str) "fast" to send as fast as possible, "original" to keep recorded timing
+    @param speed: (float) speed-up applied to the recorded timing
+    @return: (dict) throughput, latency percentiles and differing replies
+    """
+    from system_tests.performance.emulator import create_emulator, quiet
+
+    if address is None:
+        interface = create_emulator()
+        send = interface.process_request
+    else:
+        client = LineClient(*address)
+        send = client.request
+
+    latencies = []
+    mismatch_count = 0
+    mismatch_examples = []
+    missing_replies = 0
+    last_time = exchanges[0].time if exchanges else 0.0
+    start = time.perf_counter()
+    with quiet():
+        for exchange in exchanges:
+            if timing == "original":
+                delay = start + (exchange.time - exchanges[0].time) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if address is None:
+                interface.device.process(exchange.time - last_time)
+                last_time = exchange.time
+            sent = time.perf_counter()
+            reply = send(exchange.request)
+            latencies.append(time.perf_counter() - sent)
+            if reply is None and exchange.reply is not None:
+                missing_replies += 1
+            if reply != exchange.reply:
+                mismatch_count += 1
+                if len(mismatch_examples) < MISMATCH_EXAMPLES:
+                    mismatch_examples.append(
+                        {
+                            "t": exchange.time,
+                            "request": exchange.request,
+                            "recorded": exchange.reply,
+                            "replayed": reply,
+                        }
+                    )
+    elapsed = time.perf_counter() - start
+    if address is not None:
+        client.close()
+
+    return {
+        "exchanges": len(exchanges),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(exchanges) / elapsed if elapsed else 0.0,
+        "latency": summarise_latencies(latencies),
+        "missing_replies": missing_replies,
+        "mismatches": mismatch_count,
+        "mismatch_examples": mismatch_examples,
+    }
+
+
+def print_report(report: dict[str, object]) -> None:
+    latency = report["latency"]
+    print(
+        f"{report['exchanges']} exchanges in {report['elapsed_s']:.3f} s "
+        f"({report['throughput_per_s']:.1f}/s)"
+    )
+    print(
+        f"latency ms: mean {latency['mean_ms']:.3f} p50 {latency['p50_ms']:.3f} "
+        f"p90 {latency['p90_ms']:.3f} p99 {latency['p99_ms']:.3f} max {latency['max_ms']:.3f}"
+    )
+    print(f"missing replies: {report['missing_replies']}, mismatches: {report['mismatches']}")
+    for mismatch in report["mismatch_examples"]:
+        print(
+            f"  t={mismatch['t']:.3f} {mismatch['request']!r}: recorded "
+            f"{mismatch['recorded']!r}, replayed {mismatch['replayed']!r}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_args = commands.add_parser("record", help="Record a session through a proxy")
+    record_args.add_argument("--listen", required=True, help="HOST:PORT for the IOC to use")
+    record_args.add_argument("--upstream", required=True, help="HOST:PORT of the controller")
+    record_args.add_argument("session", help="Session file to write")
+
+    replay_args = commands.add_parser("replay", help="Replay a session against the emulator")
+    replay_args.add_argument("session", help="Session file to replay")
+    replay_args.add_argument("--address", help="HOST:PORT of a running emulator")
+    replay_args.add_argument("--timing", choices=["fast", "original"], default="fast")
+    replay_args.add_argument("--speed", type=float, default=1.0, help="Original timing speed-up")
+    replay_args.add_argument("--json", help="Also write the report to this file")
+    replay_args.add_argument(
+        "--fail-on-mismatch", action="store_true", help="Exit non-zero if any reply differs"
+    )
+
+    arguments = parser.parse_args(argv)
+    if arguments.command == "record":
+        listen, upstream = parse_address(arguments.listen), parse_address(arguments.upstream)
+        record(listen, upstream, arguments.session)
+        return 0
+
+    address = parse_address(arguments.address) if arguments.address else None
+    report = replay(read_session(arguments.session), address, arguments.timing, arguments.speed)
+    print_report(report)
+    if arguments.json:
+        with open(arguments.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 1 if arguments.fail_on_mismatch and report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Accelerated soak test of the PearlPC emulator and client code.
+
+Drives the emulator through repeated ramp, hold, ramp down, reset and purge cycles while
+sending the IOC's full polling load once per simulated second. In-process (the default)
+the emulator is advanced by one simulated second per polling pass without waiting, so a
+day of operation takes well under a minute. With --address or --launch the same cycles
+are run over TCP through pearlpc_client against an emulator under Lewis.
+
+Through the run it samples traced memory, the size of the emulator's containers (such as
+status_dictionary) and request latency percentiles, and fails if any grows past its
+threshold after the warm-up cycles:
+
+    python -m system_tests.performance.soak --cycles 2000 --output soak.json
+    python -m system_tests.performance.soak --launch --cycles 100
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import linecache
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from pearlpc_client import PearlPCClient
+from pearlpc_client.protocol import StatusReport, format_value, parse_status
+from system_tests.performance import stats
+from system_tests.performance.emulator import create_emulator, launch_emulator, quiet
+from system_tests.performance.stats import summarise_latencies
+from system_tests.performance.transport import IOC_POLL_REQUESTS, parse_address
+
+HIGH_PRESSURE = 400
+LOW_PRESSURE = 50  # below the 100 bar reset and purge limit
+RAMP_RATE = 40
+HOLD_PASSES = 10
+RESET_PASSES = 6
+# polling passes allowed for a ramp before the cycle counts as stuck
+RAMP_PASS_LIMIT = 100
+# seconds the client waits after a setter or action, long enough for an emulator on this
+# host to have answered it, so the acknowledgement is not taken for the next reply
+CLIENT_SETTLE_TIME = 0.01
+
+DEFAULT_MAX_MEMORY_GROWTH_KIB = 512
+DEFAULT_MAX_CONTAINER_GROWTH = 100
+DEFAULT_MAX_LATENCY_RATIO = 2.0
+# allocation sites reported when memory grows
+TOP_GROWTH = 10
+
+
+def attributes(instance: object) -> dict[str, object]:
+    """
+    @param instance: (object) object to inspect
+    @return: (dict) the object's instance attributes, whether in slots or its __dict__
+    """
+    found = dict(getattr(instance, "__dict__", {}))
+    for cls in type(instance).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name not in ("__dict__", "__weakref__") and hasattr(instance, name):
+                found[name] = getattr(instance, name)
+    return found
+
+
+class InProcessTarget:
+    """
+    An emulator driven directly, one simulated second per polling pass.
+    """
+
+    def __init__(self) -> None:
+        self.interface = create_emulator()
+
+    def request(self, request: str) -> str:
+        return self.interface.process_request(request) or ""
+
+    def advance(self, seconds: float) -> None:
+        self.interface.device.process(seconds)
+
+    def container_sizes(self) -> dict[str, int]:
+        """
+        @return: (dict) length of every container held by the device or its members
+        """
+        sizes = {}
+        for name, value in attributes(self.interface.device).items():
+            if hasattr(value, "__len__") and not isinstance(value, str):
+                sizes[name] = len(value)
+            elif type(value).__module__.startswith("system_tests."):
+                for member, member_value in attributes(value).items():
+                    if hasattr(member_value, "__len__") and not isinstance(member_value, str):
+                        sizes[f"{name}.{member}"] = len(member_value)
+        return sizes
+
+    def close(self) -> None:
+        pass
+
+
+class ClientTarget:
+    """
+    An emulator under Lewis, driven over TCP through PearlPCClient.
+    The emulator ramps as it is polled, so the cycles run as fast as the round-trips.
+    """
+
+    def __init__(self, address: tuple[str, int]) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._client = PearlPCClient(*address, settle_time=CLIENT_SETTLE_TIME)
+
+    def request(self, request: str) -> str:
+        return self._loop.run_until_complete(self._client.request(request)) or ""
+
+    def advance(self, seconds: float) -> None:
+        pass
+
+    def container_sizes(self) -> dict[str, int]:
+        return {}
+
+    def close(self) -> None:
+        self._loop.run_until_complete(self._client.close())
+        self._loop.close()
+
+
+class Soak:
+    """
+    Runs soak cycles against a target, timing every request.
+    """
+
+    def __init__(self, target: InProcessTarget | ClientTarget) -> None:
+        self.target = target
+        self.latencies = []
+        self.stuck_cycles = 0
+
+    def request(self, request: str) -> str:
+        sent = time.perf_counter()
+        reply = self.target.request(request)
+        self.latencies.append(time.perf_counter() - sent)
+        return reply
+
+    def poll(self) -> StatusReport:
+        """
+        Send one pass of the IOC's polling requests and advance a simulated second.
+        @return: (StatusReport) the status read in the pass
+        """
+        status = None
+        for request in IOC_POLL_REQUESTS:
+            reply = self.request(request)
+            if request == "st":
+                status = parse_status(reply)
+        self.target.advance(1.0)
+        return status
+
+    def poll_until(self, condition: Callable[[StatusReport], bool], limit: int) -> None:
+        for _ in range(limit):
+            if condition(self.poll()):
+                return
+        self.stuck_cycles += 1
+
+    def ramp_to(self, pressure: int, closed_loop: bool) -> None:
+        for request in (
+            format_value("ra", RAMP_RATE),
+            format_value("mx", HIGH_PRESSURE + 50),
+            format_value("mn", 1),
+            format_value("sp", pressure),
+            format_value("sloop", int(closed_loop), 1),
+            "run",
+        ):
+            self.request(request)
+        self.poll_until(lambda status: status.pressure == pressure, RAMP_PASS_LIMIT)
+
+    def cycle(self) -> None:
+        self.ramp_to(HIGH_PRESSURE, closed_loop=True)
+        for _ in range(HOLD_PASSES):
+            self.poll()
+        self.ramp_to(LOW_PRESSURE, closed_loop=False)
+        self.request("stop")
+        for request in ("reset", "pu"):
+            self.request(request)
+            for _ in range(RESET_PASSES):
+                self.poll()
+        self.request("er")
+
+    def take_latencies(self) -> dict[str, float]:
+        summary = summarise_latencies(self.latencies)
+        self.latencies = []
+        return summary
+
+
+def traced_memory(snapshot: tracemalloc.Snapshot) -> int:
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+def memory_growth(
+    start: tracemalloc.Snapshot, end: tracemalloc.Snapshot, top: int = TOP_GROWTH
+) -> list[str]:
+    """
+    @return: (list) the allocation sites whose memory grew most between the snapshots
+    """
+    growth = []
+    for stat in end.compare_to(start, "lineno")[:top]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        line = linecache.getline(frame.filename, frame.lineno).strip()
+        growth.append(
+            f"{frame.filename}:{frame.lineno} +{stat.size_diff / 1024:.1f} KiB "
+            f"({stat.count_diff:+d} blocks) {line}"
+        )
+    return growth
+
+
+def run_soak(
+    target: InProcessTarget | ClientTarget,
+    cycles: int,
+    warmup: int,
+    samples: int,
+    thresholds: dict[str, float],
+) -> dict:
+    """
+    @param target: target to soak
+    @param cycles: (int) number of cycles after the warm-up
+    @param warmup: (int) cycles run before the baseline sample
+    @param samples: (int) number of samples taken over the cycles
+    @param thresholds: (dict) max_memory_growth_kib, max_container_growth, max_latency_ratio
+    @return: (dict) samples, growth against the baseline and any failures
+    """
+    # the harness's own allocations are not part of the soak
+    filters = [
+        tracemalloc.Filter(False, module.__file__)
+        for module in (tracemalloc, fnmatch, linecache, stats, sys.modules[__name__])
+    ] + [tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    soak = Soak(target)
+    tracemalloc.start()
+    try:
+        # one redirection for the whole run; progress goes to stderr
+        with quiet():
+            for _ in range(warmup):
+                soak.cycle()
+            soak.take_latencies()
+            baseline = tracemalloc.take_snapshot().filter_traces(filters)
+            baseline_sizes = target.container_sizes()
+            started = time.perf_counter()
+            sample_every = max(1, cycles // max(1, samples))
+            history = []
+            snapshot = baseline
+            for cycle in range(1, cycles + 1):
+                soak.cycle()
+                if cycle % sample_every == 0 or cycle == cycles:
+                    snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+                    history.append(
+                        {
+                            "cycle": cycle,
+                            "elapsed_s": time.perf_counter() - started,
+                            "memory_kib": traced_memory(snapshot) / 1024,
+                            "containers": target.container_sizes(),
+                            "latency": soak.take_latencies(),
+                        }
+                    )
+                    print(
+                        f"cycle {cycle:6d} memory {history[-1]['memory_kib']:9.1f} KiB "
+                        f"p99 {history[-1]['latency']['p99_ms']:8.3f} ms",
+                        file=sys.stderr,
+                    )
+    finally:
+        tracemalloc.stop()
+        target.close()
+
+    memory_growth_kib = history[-1]["memory_kib"] - traced_memory(baseline) / 1024
+    container_growth = {
+        name: size - baseline_sizes.get(name, 0)
+        for name, size in history[-1]["containers"].items()
+        if size != baseline_sizes.get(name, 0)
+    }
+    first, last = history[0]["latency"], history[-1]["latency"]
+    latency_ratio = last["p90_ms"] / first["p90_ms"] if first["p90_ms"] else 1.0
+
+    failures = []
+    if memory_growth_kib > thresholds["max_memory_growth_kib"]:
+        failures.append(f"traced memory grew by {memory_growth_kib:.1f} KiB")
+    for name, growth in container_growth.items():
+        if growth > thresholds["max_container_growth"]:
+            failures.append(f"{name} grew by {growth} items")
+    if latency_ratio > thresholds["max_latency_ratio"]:
+        failures.append(f"p90 latency rose from {first['p90_ms']:.3f} to {last['p90_ms']:.3f} ms")
+    if soak.stuck_cycles:
+        failures.append(f"{soak.stuck_cycles} ramps did not reach their setpoint")
+    return {
+        "cycles": cycles,
+        "warmup": warmup,
+        "thresholds": thresholds,
+        "samples": history,
+        "memory_growth_kib": memory_growth_kib,
+        "top_memory_growth": memory_growth(baseline, snapshot) if failures else [],
+        "container_growth": container_growth,
+        "latency_ratio": latency_ratio,
+        "stuck_cycles": soak.stuck_cycles,
+        "failures": failures,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"cycles:            {report['cycles']} after {report['warmup']} warm-up")
+    print(f"memory growth:     {report['memory_growth_kib']:.1f} KiB")
+    print(f"container growth:  {report['container_growth'] or 'none'}")
+    print(f"p90 latency ratio: {report['latency_ratio']:.2f}")
+    for line in report["top_memory_growth"]:
+        print(f"  {line}")
+    for failure in report["failures"]:
+        print(f"FAIL {failure}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument("--address", help="HOST:PORT of a running emulator")
+    target_group.add_argument(
+        "--launch", action="store_true", help="Launch an emulator under Lewis and soak over TCP"
+    )
+    parser.add_argument("--cycles", type=int, default=500, help="Cycles after the warm-up")
+    parser.add_argument("--warmup", type=int, default=10, help="Cycles before the baseline")
+    parser.add_argument("--samples", type=int, default=20, help="Samples taken over the run")
+    parser.add_argument(
+        "--max-memory-growth-kib", type=float, default=DEFAULT_MAX_MEMORY_GROWTH_KIB
+    )
+    parser.add_argument("--max-container-growth", type=int, default=DEFAULT_MAX_CONTAINER_GROWTH)
+    parser.add_argument("--max-latency-ratio", type=float, default=DEFAULT_MAX_LATENCY_RATIO)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    arguments = parser.parse_args(argv)
+
+    thresholds = {
+        "max_memory_growth_kib": arguments.max_memory_growth_kib,
+        "max_container_growth": arguments.max_container_growth,
+        "max_latency_ratio": arguments.max_latency_ratio,
+    }
+
+    def soak(target: InProcessTarget | ClientTarget) -> dict:
+        return run_soak(target, arguments.cycles, arguments.warmup, arguments.samples, thresholds)
+
+    if arguments.launch:
+        with launch_emulator() as address:
+            report = soak(ClientTarget(address))
+    elif arguments.address:
+        report = soak(ClientTarget(parse_address(arguments.address)))
+    else:
+        report = soak(InProcessTarget())
+
+    print_report(report)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
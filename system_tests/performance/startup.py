@@ -0,0 +1,129 @@
+"""
+Startup time of the PearlPC emulator.
+
+Measures each part of bringing up an emulator, in new interpreters where the part depends
+on a cold import cache:
+ - import: importing the emulator package and its interfaces
+ - bind: creating a device and binding a stream interface to it
+ - lewis: a new Lewis process, from start until its port accepts connections
+ - launcher: a child of the pre-warmed launcher, from request until it accepts connections
+
+    python -m system_tests.performance.startup --repeat 10 --output startup.json
+"""
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import timeit
+
+from system_tests.lewis_emulators.PearlPC.launcher import LauncherClient, lewis_arguments
+from system_tests.performance.emulator import LAUNCH_TIMEOUT, create_emulator, free_port
+from system_tests.performance.stats import summarise_latencies
+
+IMPORT_SCRIPT = (
+    "import time; started = time.perf_counter(); "
+    "import system_tests.lewis_emulators.PearlPC.interfaces; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def wait_for_port(port: int, process: subprocess.Popen | None = None) -> None:
+    deadline = time.monotonic() + LAUNCH_TIMEOUT
+    while True:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Nothing listened on port {port}")
+            time.sleep(0.001)
+
+
+def time_import() -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT], text=True)
+    return float(output)
+
+
+def time_bind() -> float:
+    create_emulator()
+    return timeit.timeit(create_emulator, number=1)
+
+
+def time_lewis() -> float:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "lewis", *lewis_arguments(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process)
+        return time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def time_launcher(client: LauncherClient) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    pid = client.launch(lewis_arguments(port))
+    try:
+        wait_for_port(port)
+        return time.perf_counter() - started
+    finally:
+        client.stop(pid)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Measurements of each part")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    arguments = parser.parse_args(argv)
+
+    control_port = free_port()
+    launcher = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "system_tests.lewis_emulators.PearlPC.launcher",
+            "--control",
+            f"127.0.0.1:{control_port}",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(control_port, launcher)
+        client = LauncherClient("127.0.0.1", control_port)
+        measurements = {
+            "import": time_import,
+            "bind": time_bind,
+            "lewis": time_lewis,
+            "launcher": lambda: time_launcher(client),
+        }
+        results = {
+            name: summarise_latencies([measure() for _ in range(arguments.repeat)])
+            for name, measure in measurements.items()
+        }
+        client.close()
+    finally:
+        launcher.terminate()
+        launcher.wait(timeout=10)
+
+    print(f"{'part':<10} {'p50 ms':>9} {'max ms':>9}")
+    for name, summary in results.items():
+        print(f"{name:<10} {summary['p50_ms']:9.2f} {summary['max_ms']:9.2f}")
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import math
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+    @param sorted_values: (list) values in ascending order
+    @param fraction: (float) percentile as a fraction, e.g. 0.99
+    @return: (float) the percentile, or NaN when there are no values
+    """
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarise_latencies(latencies: list[float]) -> dict[str, float]:
+    """
+    Summarise request latencies.
+    @param latencies: (list) latencies in seconds
+    @return: (dict) count, mean, p50, p90, p99 and max, in milliseconds apart from the count
+    """
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean_ms": 1000.0 * sum(ordered) / count if count else math.nan,
+        "p50_ms": 1000.0 * percentile(ordered, 0.50),
+        "p90_ms": 1000.0 * percentile(ordered, 0.90),
+        "p99_ms": 1000.0 * percentile(ordered, 0.99),
+        "max_ms": 1000.0 * ordered[-1] if count else math.nan,
+    }
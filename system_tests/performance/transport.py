@@ -0,0 +1,64 @@
+import socket
+import time
+
+from pearlpc_client.protocol import (
+    IN_TERMINATOR,
+    REPLY_TIMEOUT,
+    expected_terminators,
+    reply_end,
+)
+
+# Requests the IOC's 1 second scans send: STATUS_ARRAY, LS_ARRAY, FLUID_TYPE and the
+# get_memory reads behind PRESSURE_CELL, PRESSURE_PUMP, PRESSURE_DIFF(_THOLD) and SF_PRESSURE
+IOC_POLL_REQUESTS = ("st", "ls", "id", "vr0087", "vr0088", "vr0082", "vr0081", "vr0126")
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """
+    @param address: (str) HOST:PORT
+    @return: (tuple) host and port
+    """
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class LineClient:
+    """
+    Blocking client for the controller's line protocol, framing replies by command.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = REPLY_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = b""
+
+    def request(self, request: str) -> str | None:
+        """
+        Send a request and wait for its complete reply.
+        @param request: (str) request without terminator
+        @return: (str) reply including terminators, or None if the reply timed out
+        """
+        self._socket.sendall((request + IN_TERMINATOR).encode())
+        expected = expected_terminators(request)
+        deadline = time.monotonic() + self.timeout
+        end = reply_end(self._buffer, expected)
+        while end < 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._buffer = b""
+                return None
+            self._socket.settimeout(remaining)
+            try:
+                data = self._socket.recv(4096)
+            except TimeoutError:
+                continue
+            if not data:
+                raise ConnectionError("Connection closed by emulator")
+            self._buffer += data
+            end = reply_end(self._buffer, expected)
+        reply, self._buffer = self._buffer[:end], self._buffer[end:]
+        return reply.decode()
+
+    def close(self) -> None:
+        self._socket.close()
@@ -1,5 +1,10 @@
+import contextlib
+import importlib.util
 import itertools
+import os
+import tempfile
 import unittest
+from array import array
 
 from parameterized import parameterized
 from utils.channel_access import ChannelAccess
@@ -23,6 +28,20 @@ IOCS = [
 
 TEST_MODES = [TestModes.DEVSIM]
 
+TELEMETRY_MODULE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "lewis_emulators", "PearlPC", "telemetry.py"
+)
+
+
+def load_telemetry_module():
+    """
+    Load the emulator's telemetry module, which stands alone, to read recordings back.
+    """
+    spec = importlib.util.spec_from_file_location("pearlpc_telemetry", TELEMETRY_MODULE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 
 INPUT_PVS = [
     "INPUTS:EM_STOP_RELEASED",
@@ -235,6 +254,34 @@ class PEARLPCTests(unittest.TestCase):
         self.lewis.backdoor_run_function_on_device("set_pressures", [pump_pressure, cell_pressure])
         self.ca.assert_that_pv_is("PRESSURE_DIFF", cell_pressure - pump_pressure)
 
+    @parameterized.expand(
+        parameterized_list([("PRESSURE", 200), ("PRESSURE_CELL", 300), ("PRESSURE_PUMP", 100)])
+    )
+    def test_WHEN_pressures_read_THEN_history_and_decimated_views_end_with_newest_value(
+        self, _, pv, pressure
+    ):
+        self.lewis.backdoor_run_function_on_device("set_pressures", [100, 300])
+
+        def ends_with_pressure(history):
+            return len(history) > 0 and history[-1] == pressure
+
+        self.ca.assert_that_pv_value_causes_func_to_return_true(f"{pv}:HIST", ends_with_pressure)
+        # a full 10 second window at the new pressures
+        for stat in ["MEAN", "MIN", "MAX"]:
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                f"{pv}:HIST:10S:{stat}", ends_with_pressure, timeout=30
+            )
+
+    @parameterized.expand(parameterized_list(["PRESSURE", "PRESSURE_CELL", "PRESSURE_PUMP"]))
+    def test_WHEN_device_disconnected_THEN_no_samples_added_to_history(self, _, pv):
+        self.ca.assert_that_pv_value_is_increasing(f"{pv}:HIST.NUSE", wait=3)
+        self.lewis.backdoor_set_on_device("connected", False)
+        try:
+            self.ca.assert_that_pv_alarm_is(pv, self.ca.Alarms.INVALID)
+            self.ca.assert_that_pv_value_is_unchanged(f"{pv}:HIST.NUSE", wait=5)
+        finally:
+            self.lewis.backdoor_set_on_device("connected", True)
+
     @parameterized.expand(parameterized_list([1, 999]))
     def test_WHEN_difference_threshold_set_on_hardware_THEN_can_be_read_back_by_ioc(self, _, val):
         self.ca.set_pv_value("PRESSURE_DIFF_THOLD:SP", val)
@@ -330,3 +377,286 @@ class PEARLPCTests(unittest.TestCase):
         self.ca.assert_that_pv_is("PURGE:SP.DISP", "0")
         self.ca.set_pv_value("PURGE:SP", 1)
         self.ca.assert_that_pv_is("PURGE_STATUS", 1)
+
+    @contextlib.contextmanager
+    def replaying_pressures(self, samples):
+        """
+        Replay interleaved cell/pump pressures on the emulator, one sample per second.
+        """
+        with tempfile.TemporaryDirectory() as trace_dir:
+            trace_path = os.path.join(trace_dir, "trace.bin")
+            with open(trace_path, "wb") as trace_file:
+                array("d", samples).tofile(trace_file)
+
+            self.lewis.backdoor_run_function_on_device("load_pressure_trace", [trace_path, 1.0])
+            try:
+                yield
+            finally:
+                # release the memory map so the file can be removed
+                self.lewis.backdoor_run_function_on_device("clear_pressure_trace")
+
+    def test_WHEN_pressure_trace_replayed_THEN_pressures_and_difference_follow_recording(self):
+        # transducers agree, then diverge
+        with self.replaying_pressures([300, 300] * 10 + [350, 300] * 10):
+            self.ca.assert_that_pv_is("PRESSURE_CELL", 300)
+            self.ca.assert_that_pv_is("PRESSURE_PUMP", 300)
+            self.ca.assert_that_pv_alarm_is("PRESSURE_DIFF", self.ca.Alarms.NONE)
+
+            self.ca.assert_that_pv_is("PRESSURE_CELL", 350)
+            self.ca.assert_that_pv_is("PRESSURE_DIFF", 50)
+            self.ca.assert_that_pv_alarm_is("PRESSURE_DIFF", self.ca.Alarms.MAJOR)
+
+    def test_WHEN_pressure_ramps_slower_than_commanded_THEN_eta_uses_achieved_rate(self):
+        self.lewis.backdoor_set_on_device("setpoint_value", 700)
+        self.lewis.backdoor_set_on_device("pressure_rate", 600)
+        # 1 bar per second is 60 bar/min, a tenth of the commanded rate
+        with self.replaying_pressures([pressure for t in range(600) for pressure in (t, t)]):
+            self.ca.assert_that_pv_is_number("PRESSURE:RATE:ACHIEVED", 60, tolerance=6, timeout=40)
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                "PRESSURE:ETA", lambda eta: 0 < eta < 12
+            )
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                "PRESSURE:TIME_TO_TGT", lambda minutes: minutes > 1.2
+            )
+            self.ca.assert_that_pv_is("PRESSURE:STALLED", "NO")
+
+    def test_WHEN_device_disconnected_during_ramp_THEN_rate_invalid_and_window_restarted(self):
+        self.lewis.backdoor_set_on_device("setpoint_value", 700)
+        self.lewis.backdoor_set_on_device("pressure_rate", 600)
+        with self.replaying_pressures([pressure for t in range(600) for pressure in (t, t)]):
+            self.ca.assert_that_pv_is_number("PRESSURE:RATE:ACHIEVED", 60, tolerance=6, timeout=40)
+
+            with self.lewis.backdoor_simulate_disconnected_device():
+                for pv in ("PRESSURE:RATE:ACHIEVED", "PRESSURE:ETA", "PRESSURE:STALLED"):
+                    self.ca.assert_that_pv_alarm_is(pv, self.ca.Alarms.INVALID)
+                self.ca.assert_that_pv_is("PRESSURE:RATE:_WINDOW.NORD", 0)
+                self.ca.assert_that_pv_is("PRESSURE:STALLED", "NO")
+
+            # the rate is fitted to reads since reconnection only
+            self.ca.assert_that_pv_alarm_is("PRESSURE:RATE:ACHIEVED", self.ca.Alarms.NONE)
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                "PRESSURE:RATE:_WINDOW.NORD", lambda reads: 0 < reads < 10
+            )
+            self.ca.assert_that_pv_is_number("PRESSURE:RATE:ACHIEVED", 60, tolerance=6, timeout=40)
+
+    def test_WHEN_running_and_pressure_does_not_move_THEN_stalled_and_no_eta(self):
+        self.lewis.backdoor_set_on_device("setpoint_value", 500)
+        self.lewis.backdoor_set_on_device("pressure_rate", 10)
+        with self.replaying_pressures([200, 200] * 120):
+            self.lewis.backdoor_run_function_on_device("set_ru", [1])
+            self.ca.assert_that_pv_is("PRESSURE:STALLED", "YES", timeout=60)
+            self.ca.assert_that_pv_alarm_is("PRESSURE:STALLED", self.ca.Alarms.MINOR)
+            self.ca.assert_that_pv_is("PRESSURE:RATE:ACHIEVED", 0)
+            self.ca.assert_that_pv_is("PRESSURE:ETA", -1)
+
+    def load_profile(self, setpoints, rates, holds, loop_modes):
+        self.ca.set_pv_value("SEQ:SETPOINTS", setpoints)
+        self.ca.set_pv_value("SEQ:RATES", rates)
+        self.ca.set_pv_value("SEQ:HOLDS", holds)
+        self.ca.set_pv_value("SEQ:LOOPMODES", loop_modes)
+        self.ca.set_pv_value("SEQ:NSTEPS", len(setpoints))
+
+    def test_WHEN_profile_started_THEN_steps_through_setpoints_holding_at_each(self):
+        self.load_profile([50, 80, 30], [40, 40, 40], [3, 3, 0], [1, 1, 0])
+        self.ca.set_pv_value("SEQ:START", 1)
+
+        for step, setpoint in enumerate([50, 80]):
+            self.ca.assert_that_pv_is("SEQ:STEP", step)
+            self.ca.assert_that_pv_is("SEQ:STATE", "Holding")
+            self.ca.assert_that_pv_is("PRESSURE:SP:RBV", setpoint)
+            self.ca.assert_that_pv_is("PRESSURE", setpoint)
+        self.ca.assert_that_pv_is("SEQ:STATE", "Done", timeout=30)
+        self.ca.assert_that_pv_is("SEQ:STEP", 2)
+        self.ca.assert_that_pv_is("PRESSURE", 30)
+        self.ca.assert_that_pv_is("SERVO", "Open Loop")
+
+    def test_WHEN_profile_setpoint_out_of_range_THEN_sequence_faults(self):
+        self.load_profile([50, 200], [40, 40], [0, 0], [1, 1])
+        self.ca.set_pv_value("SEQ:START", 1)
+        self.ca.assert_that_pv_is("SEQ:STATE", "Fault", timeout=30)
+        self.ca.assert_that_pv_is("SEQ:STEP", 1)
+        self.ca.assert_that_pv_alarm_is("SEQ:STATE", self.ca.Alarms.MAJOR)
+
+    def test_WHEN_profile_shorter_than_number_of_steps_THEN_sequence_faults(self):
+        self.load_profile([50], [40], [0], [1])
+        self.ca.set_pv_value("SEQ:NSTEPS", 2)
+        self.ca.set_pv_value("SEQ:START", 1)
+        self.ca.assert_that_pv_is("SEQ:STATE", "Fault")
+
+    def test_WHEN_profile_aborted_while_holding_THEN_sequence_stops_and_pressure_held(self):
+        self.load_profile([60], [40], [1000], [1])
+        self.ca.set_pv_value("SEQ:START", 1)
+        self.ca.assert_that_pv_is("SEQ:STATE", "Holding")
+        self.ca.set_pv_value("SEQ:ABORT", 1)
+        self.ca.assert_that_pv_is("SEQ:STATE", "Aborted")
+        self.ca.assert_that_pv_value_is_unchanged("SEQ:HOLD_REMAINING", wait=3)
+        self.ca.assert_that_pv_is("PRESSURE", 60)
+
+    def test_WHEN_closed_loop_pressure_leaves_band_THEN_device_reservos_to_setpoint(self):
+        self.ca.set_pv_value("SERVO:SP", "Closed Loop")
+        self.start_device_with_parameters(10, 100, 50, 10)
+        self.ca.assert_that_pv_is("PRESSURE", 50)
+        self.lewis.backdoor_run_function_on_device("set_pressures", [5, 5])
+        self.ca.assert_that_pv_is("PRESSURE", 5)
+        self.ca.assert_that_pv_is("PRESSURE", 50)
+
+    def test_WHEN_cell_transducer_offset_THEN_difference_read_and_in_alarm(self):
+        self.lewis.backdoor_run_function_on_device("set_pressures", [100, 100])
+        self.lewis.backdoor_run_function_on_device("set_transducer_model", [1, 0.0, 5.0, 0.0])
+        self.ca.assert_that_pv_is("PRESSURE_CELL", 105)
+        self.ca.assert_that_pv_is("PRESSURE_PUMP", 100)
+        self.ca.assert_that_pv_is("PRESSURE_DIFF", 5)
+        self.ca.assert_that_pv_alarm_is("PRESSURE_DIFF", self.ca.Alarms.MAJOR)
+
+    def test_WHEN_transducer_noisy_THEN_reading_changes_while_pressure_held(self):
+        self.lewis.backdoor_run_function_on_device("set_pressures", [100, 100])
+        self.lewis.backdoor_run_function_on_device("set_transducer_model", [2, 2.0, 0.0, 0.0])
+        self.ca.assert_that_pv_value_is_changing("PRESSURE_PUMP", wait=5)
+        self.ca.assert_that_pv_value_is_unchanged("PRESSURE_CELL", wait=5)
+
+    def test_WHEN_transducer_drifts_THEN_reading_drifts_until_transducer_reset(self):
+        self.lewis.backdoor_run_function_on_device("set_pressures", [100, 100])
+        # 60 bar/min, so 1 bar every second
+        self.lewis.backdoor_run_function_on_device("set_transducer_model", [2, 0.0, 0.0, 60.0])
+        self.ca.assert_that_pv_value_causes_func_to_return_true(
+            "PRESSURE_PUMP", lambda pressure: pressure >= 105
+        )
+        self.lewis.backdoor_run_function_on_device("transducer_reset")
+        self.ca.assert_that_pv_value_causes_func_to_return_true(
+            "PRESSURE_PUMP", lambda pressure: pressure < 105
+        )
+
+    def test_WHEN_transducers_disagree_by_more_than_threshold_while_running_THEN_error(self):
+        self.lewis.backdoor_run_function_on_device("set_transducer_model", [1, 0.0, 5.0, 0.0])
+        self.start_device_with_parameters(10, 100, 50, 10)
+        self.ca.assert_that_pv_is("ERRCODE", 10)
+        self.ca.assert_that_pv_is("RUN", "Inactive")
+
+    def test_WHEN_pressure_drops_by_more_than_seal_fail_value_THEN_seal_fail_latched(self):
+        self.ca.set_pv_value("SF_PRESSURE:SP", 10)
+        self.ca.assert_that_pv_is("SF_PRESSURE", 10)
+        self.lewis.backdoor_run_function_on_device("set_pressures", [80, 80])
+        self.ca.assert_that_pv_is("PRESSURE", 80)
+        self.ca.assert_that_pv_is("SF", "OK")
+
+        self.lewis.backdoor_run_function_on_device("set_pressures", [60, 60])
+        self.ca.assert_that_pv_is("SF", "Failed")
+        self.ca.assert_that_pv_is("ERRCODE", 8)
+
+        self.ca.set_pv_value("ERRCODE:RESET", 1)
+        self.ca.assert_that_pv_value_is_unchanged("ERRCODE", wait=3)
+        self.ca.assert_that_pv_is("ERRCODE", 8)
+
+    def test_WHEN_pressure_drop_within_seal_fail_value_THEN_no_seal_fail(self):
+        self.ca.set_pv_value("SF_PRESSURE:SP", 30)
+        self.ca.assert_that_pv_is("SF_PRESSURE", 30)
+        self.lewis.backdoor_run_function_on_device("set_pressures", [80, 80])
+        self.ca.assert_that_pv_is("PRESSURE", 80)
+        self.lewis.backdoor_run_function_on_device("set_pressures", [60, 60])
+        self.ca.assert_that_pv_is("PRESSURE", 60)
+        self.ca.assert_that_pv_value_is_unchanged("SF", wait=3)
+        self.ca.assert_that_pv_is("SF", "OK")
+        self.ca.assert_that_pv_is("ERRCODE", 0)
+
+    def test_WHEN_commanded_to_decrease_pressure_THEN_no_seal_fail(self):
+        self.ca.set_pv_value("SF_PRESSURE:SP", 10)
+        self.ca.assert_that_pv_is("SF_PRESSURE", 10)
+        self.start_device_with_parameters(10, 100, 80, 40)
+        self.ca.assert_that_pv_is("PRESSURE", 80)
+        self.start_device_with_parameters(10, 100, 20, 40)
+        self.ca.assert_that_pv_is("PRESSURE", 20)
+        self.ca.assert_that_pv_is("SF", "OK")
+        self.ca.assert_that_pv_is("ERRCODE", 0)
+
+    def test_WHEN_status_replies_delayed_THEN_round_trip_time_includes_delay(self):
+        self.lewis.backdoor_run_function_on_device("set_reply_delay", ["st", 0.5])
+        self.ca.assert_that_pv_is_within_range("COMMS:ST:RTT", 500, 2000)
+        self.lewis.backdoor_run_function_on_device("set_reply_delay", ["st", 0])
+        self.ca.assert_that_pv_is_within_range("COMMS:ST:RTT", 0, 400)
+
+    def test_WHEN_limits_replies_slower_than_reply_timeout_THEN_timeouts_counted(self):
+        timeouts = self.ca.get_pv_value("COMMS:LS:TIMEOUTS")
+        self.lewis.backdoor_run_function_on_device("set_reply_delay", ["ls", 3.0])
+        try:
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                "COMMS:LS:TIMEOUTS", lambda value: value > timeouts
+            )
+        finally:
+            self.lewis.backdoor_run_function_on_device("set_reply_delay", ["ls", 0])
+
+    def test_WHEN_device_replies_with_junk_THEN_mismatches_counted(self):
+        mismatches = self.ca.get_pv_value("COMMS:ST:MISMATCHES")
+        self.lewis.backdoor_set_on_device("is_giving_errors", True)
+        try:
+            self.ca.assert_that_pv_value_causes_func_to_return_true(
+                "COMMS:ST:MISMATCHES", lambda value: value > mismatches
+            )
+        finally:
+            self.lewis.backdoor_set_on_device("is_giving_errors", False)
+
+    def test_WHEN_polling_THEN_port_utilisation_is_a_percentage(self):
+        self.ca.assert_that_pv_is_within_range("COMMS:PORT:UTILISATION", 0, 100)
+
+    def test_WHEN_lockstep_THEN_pressure_only_ramps_when_stepped(self):
+        self.lewis.backdoor_run_function_on_device("set_lockstep", [True])
+        try:
+            self.ca.set_pv_value("USER_LIMIT:SP", 100)
+            self.ca.set_pv_value("MX_PRESSURE:SP", 100)
+            self.ca.set_pv_value("PRESSURE:SP", 40)
+            self.ca.set_pv_value("PRESSURE_RATE:SP", 10)
+            self.ca.process_pv("SEND_PARAMETERS")
+            self.ca.assert_that_pv_is("PRESSURE_RATE", 10)
+            self.ca.set_pv_value("RUN:SP", 1)
+            self.lewis.assert_that_emulator_value_is("run_requested", "1")
+
+            self.ca.assert_that_pv_value_is_unchanged("PRESSURE", wait=3)
+            self.ca.assert_that_pv_is("PRESSURE", 0)
+
+            self.lewis.backdoor_run_function_on_device("step", [2, 1.0])
+            self.ca.assert_that_pv_is("RUN", "Active")
+            self.ca.assert_that_pv_is("PRESSURE", 20)
+            self.ca.assert_that_pv_value_is_unchanged("PRESSURE", wait=3)
+
+            self.lewis.backdoor_run_function_on_device("advance_to", [10.0])
+            self.ca.assert_that_pv_is("PRESSURE", 40)
+        finally:
+            self.lewis.backdoor_run_function_on_device("set_lockstep", [False])
+
+    def test_WHEN_steps_recorded_THEN_telemetry_read_back_in_slices(self):
+        telemetry = load_telemetry_module()
+        with tempfile.TemporaryDirectory() as telemetry_dir:
+            path = os.path.join(telemetry_dir, "run.tlm")
+            self.lewis.backdoor_run_function_on_device("set_lockstep", [True])
+            try:
+                self.lewis.backdoor_run_function_on_device("set_pressures", [30, 30])
+                # 250 steps in chunks of 100 rows, the last chunk part full
+                self.lewis.backdoor_run_function_on_device("start_recording", [path, 100])
+                self.lewis.backdoor_run_function_on_device("step", [250, 1.0])
+            finally:
+                self.lewis.backdoor_run_function_on_device("stop_recording")
+                self.lewis.backdoor_run_function_on_device("set_lockstep", [False])
+
+            reader = telemetry.TelemetryReader(path)
+            try:
+                self.assertEqual(reader.length, 250)
+                # a slice across the first chunk boundary
+                rows = reader.read(95, 105, ["time", "pressure"])
+                self.assertEqual(list(rows), ["time", "pressure"])
+                times = list(rows["time"])
+                self.assertEqual(len(times), 10)
+                self.assertEqual([b - a for a, b in itertools.pairwise(times)], [1.0] * 9)
+                self.assertEqual(list(rows["pressure"]), [30] * 10)
+                self.assertEqual(list(reader.read(0, 250)["time"])[95:105], times)
+                self.assertRaises(ValueError, reader.read, -1)
+            finally:
+                reader.close()
+
+            # a chunk cut short, as by a crash, is left out
+            with open(path, "r+b") as telemetry_file:
+                telemetry_file.truncate(os.path.getsize(path) - 1)
+            reader = telemetry.TelemetryReader(path)
+            try:
+                self.assertEqual(reader.length, 200)
+                self.assertEqual(len(reader.read(150)["time"]), 50)
+            finally:
+                reader.close()
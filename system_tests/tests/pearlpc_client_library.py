@@ -0,0 +1,164 @@
+"""
+Tests of pearlpc_client against the emulator under Lewis. The tests start their own
+emulators, so no IOC is needed.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import unittest
+
+from lewis.core.control_client import ControlClient
+from utils.test_modes import TestModes
+
+# the client library and performance tools are imported from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from pearlpc_client import PearlPCClient, PearlPCPool, ReplyTimeout, StatusReport
+from pearlpc_client.protocol import find_reply, format_value, is_query, parse_identity
+from system_tests.performance.emulator import free_port, launch_emulator
+
+IOCS = []
+
+TEST_MODES = [TestModes.DEVSIM]
+
+# settle time short enough to keep the tests quick, but long enough for a local emulator
+SETTLE_TIME = 0.02
+REPLY_TIMEOUT = 0.5
+
+
+class PearlPCClientTests(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.control_port = free_port()
+        cls.address = cls.enterClassContext(launch_emulator(control_port=cls.control_port))
+        cls.device = ControlClient("127.0.0.1", cls.control_port).get_object("device")
+
+    async def asyncSetUp(self):
+        self.device.re_initialise()
+        self.client = PearlPCClient(
+            *self.address, reply_timeout=REPLY_TIMEOUT, settle_time=SETTLE_TIME
+        )
+        self.addAsyncCleanup(self.client.close)
+
+    async def test_WHEN_setters_pipelined_with_queries_THEN_each_query_gets_its_own_reply(self):
+        results = await asyncio.gather(
+            self.client.set_rate(20),
+            self.client.cell_pressure(),
+            self.client.read_memory(126),
+            self.client.set_seal_fail(30),
+            self.client.read_memory(126),
+            self.client.status(),
+            self.client.identity(),
+            self.client.read_memory(81),
+        )
+
+        self.assertEqual(results[2], 0)
+        self.assertEqual(results[4], 30)
+        self.assertIsInstance(results[5], StatusReport)
+        self.assertEqual(results[5].rate, 20)
+        self.assertEqual(results[6].fluid_type, "Pentane")
+        self.assertEqual(results[7], 2)
+
+    async def test_WHEN_controller_rejects_setter_THEN_later_queries_keep_their_replies(self):
+        # the controller does not reply to a value out of range, so nothing is waited for
+        results = await asyncio.gather(
+            self.client.request("sf1000"),
+            self.client.cell_pressure(),
+            self.client.read_memory(126),
+            self.client.read_memory(81),
+        )
+
+        self.assertEqual(results, [None, 0, 0, 2])
+
+    async def test_WHEN_setter_value_out_of_range_THEN_raises_without_sending(self):
+        with self.assertRaises(ValueError):
+            await self.client.set_rate(50)
+        with self.assertRaises(ValueError):
+            await self.client.set_setpoint(0)
+
+        self.assertFalse(self.client.connected)
+        status = await self.client.status()
+        self.assertEqual((status.rate, status.setpoint), (0, 0))
+
+    async def test_WHEN_reply_times_out_THEN_raises_and_next_request_reconnects(self):
+        await self.client.status()
+        self.device.connected = False
+        try:
+            with self.assertRaises(ReplyTimeout):
+                await self.client.read_memory(126)
+            self.assertFalse(self.client.connected)
+        finally:
+            self.device.connected = True
+
+        self.assertEqual(await self.client.read_memory(126), 0)
+        self.assertTrue(self.client.connected)
+
+    async def test_WHEN_reply_times_out_THEN_pipelined_requests_fail_too(self):
+        self.device.connected = False
+        try:
+            results = await asyncio.gather(
+                self.client.status(), self.client.limits(), return_exceptions=True
+            )
+        finally:
+            self.device.connected = True
+
+        self.assertIsInstance(results[0], ReplyTimeout)
+        self.assertIsInstance(results[1], ReplyTimeout)
+
+
+class PearlPCPoolTests(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.ExitStack() as emulators:
+            cls.addresses = [emulators.enter_context(launch_emulator()) for _ in range(2)]
+            cls.addClassCleanup(emulators.pop_all().close)
+
+    async def test_WHEN_operation_gathered_THEN_runs_on_every_controller(self):
+        async with PearlPCPool(self.addresses, reply_timeout=REPLY_TIMEOUT) as pool:
+            self.assertIs(pool.client(*self.addresses[0]), pool.client(*self.addresses[0]))
+            statuses = await pool.gather(lambda client: client.status())
+
+        self.assertEqual(set(statuses), set(self.addresses))
+        for status in statuses.values():
+            self.assertIsInstance(status, StatusReport)
+
+    async def test_WHEN_controller_unreachable_THEN_its_error_returned_and_others_answered(self):
+        unreachable = ("127.0.0.1", free_port())
+        async with PearlPCPool([*self.addresses, unreachable], reply_timeout=REPLY_TIMEOUT) as pool:
+            pressures = await pool.gather(lambda client: client.cell_pressure())
+
+        self.assertIsInstance(pressures.pop(unreachable), OSError)
+        self.assertEqual(pressures, {address: 0 for address in self.addresses})
+
+
+class ProtocolTests(unittest.TestCase):
+    def test_WHEN_id_reply_has_no_trailing_terminator_THEN_framed_at_cr_lf_lf(self):
+        # as the controller sends it; the emulator appends a further CR LF
+        reply = b"\r\n1234 5678 ISIS PEARL INTENSIFIER CONTROLLER V2.4 Oil\r\n\n"
+
+        start, end = find_reply(reply + b"vr0087", "id")
+
+        self.assertEqual(end, len(reply))
+        identity = parse_identity(reply[start:end].decode())
+        self.assertEqual((identity.initial_id, identity.fluid_type), (1234, "Oil"))
+
+    def test_WHEN_blank_lines_before_reply_THEN_skipped(self):
+        self.assertEqual(find_reply(b"\r\n\r\nvr0087 5\r\n", "vr0087"), (4, 14))
+        self.assertEqual(find_reply(b"\r\n\r\nvr0087 5", "vr0087"), (4, -1))
+
+    def test_WHEN_request_only_reads_THEN_is_query(self):
+        for request in ("st", "ls", "id", "dt", "vr0087"):
+            self.assertTrue(is_query(request), request)
+        for request in ("stop", "sp0100", "sloop1", "sd1111", "run", "er"):
+            self.assertFalse(is_query(request), request)
+
+    def test_WHEN_value_in_range_THEN_zero_padded(self):
+        self.assertEqual(format_value("ra", 5), "ra0005")
+        self.assertEqual(format_value("sloop", 1, 1), "sloop1")
+
+    def test_WHEN_value_out_of_range_THEN_error(self):
+        for command, value in (("ra", 41), ("sp", 1001), ("sp", 0), ("sf", 1000), ("vr", 1024)):
+            with self.subTest(command=command, value=value), self.assertRaises(ValueError):
+                format_value(command, value)
@@ -0,0 +1,286 @@
+"""
+Tests of the emulator's own machinery, run in-process or under Lewis without an IOC.
+"""
+
+import contextlib
+import io
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from utils.test_modes import TestModes
+
+# the emulator package is imported from the repository root, as the performance tools do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from pearlpc_client.protocol import OUT_TERMINATOR
+from system_tests.lewis_emulators.PearlPC import SimulatedPearlPC
+from system_tests.lewis_emulators.PearlPC.interfaces import PearlPCAsyncioStreamInterface
+from system_tests.lewis_emulators.PearlPC.interfaces.asyncio_adapter import AsyncioStreamAdapter
+from system_tests.lewis_emulators.PearlPC.launcher import LauncherClient, lewis_arguments
+from system_tests.performance.emulator import free_port, quiet
+from system_tests.performance.startup import wait_for_port
+from system_tests.performance.transport import LineClient
+
+IOCS = []
+
+TEST_MODES = [TestModes.DEVSIM]
+
+# seconds to wait for a reply, or for the adapter to act, before failing
+TIMEOUT = 5.0
+
+
+def read_lines(sock: socket.socket, count: int) -> list[str]:
+    """
+    @return: (list) the next count lines received, without terminators
+    """
+    data = b""
+    while data.count(OUT_TERMINATOR) < count:
+        received = sock.recv(65536)
+        if not received:
+            raise ConnectionError("Connection closed by the adapter")
+        data += received
+    return data.decode().split(OUT_TERMINATOR.decode())[:count]
+
+
+class AsyncioStreamAdapterTests(unittest.TestCase):
+    """
+    The adapter served in-process on a background thread, as Lewis's simulation cycle does.
+    """
+
+    def setUp(self):
+        self.enterContext(quiet())
+
+    def start_adapter(self, **options: object) -> AsyncioStreamAdapter:
+        interface = PearlPCAsyncioStreamInterface()
+        interface.device = SimulatedPearlPC()
+        adapter = AsyncioStreamAdapter(
+            {"bind_address": "127.0.0.1", "port": free_port(), **options}
+        )
+        adapter.interface = interface
+        adapter.device_lock = threading.Lock()
+        adapter.start_server()
+        serving = threading.Event()
+        serving.set()
+
+        def serve() -> None:
+            while serving.is_set():
+                adapter.handle(0.01)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            serving.clear()
+            thread.join()
+            adapter.stop_server()
+
+        self.addCleanup(stop)
+        return adapter
+
+    def connect(self, adapter: AsyncioStreamAdapter, **socket_options: int) -> socket.socket:
+        sock = socket.socket()
+        for option, value in socket_options.items():
+            sock.setsockopt(socket.SOL_SOCKET, getattr(socket, option), value)
+        sock.settimeout(TIMEOUT)
+        sock.connect((adapter._options.bind_address, adapter._options.port))
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_WHEN_requests_pipelined_on_several_connections_THEN_each_gets_its_replies_in_order(
+        self,
+    ):
+        adapter = self.start_adapter()
+        connections = [self.connect(adapter) for _ in range(3)]
+        addresses = range(100)
+
+        for sock in connections:
+            sock.sendall(b"".join(f"vr{address:04d}\r".encode() for address in addresses))
+
+        for sock in connections:
+            replies = read_lines(sock, len(addresses))
+            self.assertEqual(
+                [reply.split()[0] for reply in replies],
+                [f"vr{address:04d}" for address in addresses],
+            )
+
+    def test_WHEN_client_does_not_read_replies_THEN_pushed_back_and_others_served(self):
+        adapter = self.start_adapter(max_pipelined_requests=4, write_buffer_limit=1024)
+        slow = self.connect(adapter, SO_RCVBUF=4096, SO_SNDBUF=4096)
+        other = self.connect(adapter)
+
+        # without backpressure the adapter would read, and reply to, requests without end
+        slow.setblocking(False)
+        requests = b"st\r" * 1000
+        sent = 0
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                sent += slow.send(requests)
+            except BlockingIOError:
+                break
+        else:
+            self.fail(f"Sent {sent} bytes of requests without the adapter pushing back")
+
+        start = time.monotonic()
+        other.sendall(b"vr0081\r")
+        self.assertEqual(read_lines(other, 1), ["vr0081 2"])
+        self.assertLess(time.monotonic() - start, 1.0)
+
+        slow.setblocking(True)
+        self.assertEqual(read_lines(slow, 1), ["Status Report"])
+
+    def test_WHEN_reply_delayed_THEN_only_its_connection_waits(self):
+        adapter = self.start_adapter()
+        adapter.interface.device.set_reply_delay("ls", 1.0)
+        delayed = self.connect(adapter)
+        other = self.connect(adapter)
+
+        start = time.monotonic()
+        delayed.sendall(b"ls\rvr0081\r")
+        other.sendall(b"vr0081\r")
+
+        self.assertEqual(read_lines(other, 1), ["vr0081 2"])
+        self.assertLess(time.monotonic() - start, 0.5)
+        replies = read_lines(delayed, 4)
+        self.assertGreaterEqual(time.monotonic() - start, 1.0)
+        self.assertEqual(
+            (replies[0], replies[3]), ("User +Change +Offset -Change -Offset", "vr0081 2")
+        )
+
+    def test_WHEN_replying_fails_THEN_connection_closed_and_error_logged(self):
+        adapter = self.start_adapter()
+        sock = self.connect(adapter)
+
+        with (
+            mock.patch.object(
+                adapter.interface, "process_request", side_effect=RuntimeError("failed")
+            ),
+            self.assertLogs("lewis", "ERROR") as logs,
+        ):
+            sock.sendall(b"st\r")
+            # closed without the client sending anything more
+            self.assertEqual(sock.recv(1024), b"")
+
+        self.assertIn("RuntimeError: failed", logs.output[0])
+
+    def test_WHEN_client_resets_connection_THEN_connection_closed(self):
+        adapter = self.start_adapter(write_buffer_limit=1024)
+        sock = self.connect(adapter, SO_RCVBUF=4096)
+        sock.sendall(b"st\r" * 1000)
+        while not adapter._connections:
+            time.sleep(0.01)
+
+        # close with a reset rather than an orderly shutdown
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        sock.close()
+
+        deadline = time.monotonic() + TIMEOUT
+        while adapter._connections and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(adapter._connections)
+
+
+class LauncherTests(unittest.TestCase):
+    """
+    A launcher started as the performance tools start it, in its own process.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stderr = cls.enterClassContext(tempfile.TemporaryFile("w+"))
+        control_port = free_port()
+        launcher = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "system_tests.lewis_emulators.PearlPC.launcher",
+                "--control",
+                f"127.0.0.1:{control_port}",
+            ],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."),
+            stdout=subprocess.DEVNULL,
+            stderr=cls.stderr,
+        )
+        cls.addClassCleanup(launcher.wait, timeout=10)
+        cls.addClassCleanup(launcher.terminate)
+        wait_for_port(control_port, launcher)
+        cls.control_port = control_port
+
+    def setUp(self):
+        # the launcher serves one connection at a time
+        self.client = LauncherClient("127.0.0.1", self.control_port)
+        self.addCleanup(self.client.close)
+
+    def assert_process_gone(self, pid: int) -> None:
+        # a process that has exited but is not yet reaped can still be signalled
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return
+            time.sleep(0.01)
+        self.fail(f"Process {pid} was not reaped")
+
+    def test_WHEN_emulator_launched_and_stopped_THEN_serves_then_is_reaped(self):
+        port = free_port()
+        pid = self.client.launch(lewis_arguments(port))
+        try:
+            wait_for_port(port)
+            client = LineClient("127.0.0.1", port)
+            self.addCleanup(client.close)
+            self.assertEqual(client.request("vr0081"), "vr0081 2\r\n")
+        finally:
+            self.client.stop(pid)
+
+        self.assert_process_gone(pid)
+        with self.assertRaises(RuntimeError):
+            self.client.stop(pid)
+
+    def test_WHEN_emulator_fails_to_start_THEN_traceback_printed_and_reaped(self):
+        # arguments that are not all strings fail in Lewis's argument parser
+        pid = self.client.launch(["-k", 1])
+        # the launcher reaps it while waiting for a connection, without another request
+        self.client.close()
+        self.assert_process_gone(pid)
+
+        self.stderr.seek(0)
+        self.assertIn("Traceback", self.stderr.read())
+        self.client = LauncherClient("127.0.0.1", self.control_port)
+        self.addCleanup(self.client.close)
+        with self.assertRaises(RuntimeError):
+            self.client.stop(pid)
+
+    def test_WHEN_process_not_launched_here_THEN_not_stopped(self):
+        with self.assertRaises(RuntimeError):
+            self.client.stop(os.getpid())
+        with self.assertRaises(RuntimeError):
+            self.client.stop("1")
+
+
+class TelemetryTests(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists("/dev/full"), "needs a device that is always full")
+    def test_WHEN_telemetry_cannot_be_written_THEN_recording_stopped_and_emulator_runs_on(self):
+        device = SimulatedPearlPC()
+        # the header fits the file's buffer, so only the flusher's writes fail
+        device.start_recording("/dev/full", chunk_rows=1)
+        output = io.StringIO()
+
+        deadline = time.monotonic() + TIMEOUT
+        with contextlib.redirect_stdout(output):
+            while device.telemetry is not None and time.monotonic() < deadline:
+                device.process(0.1)
+                time.sleep(0.01)
+            device.process(0.1)
+
+        self.assertIsNone(device.telemetry)
+        self.assertEqual(output.getvalue().count("Telemetry recording stopped"), 1)
+        self.assertIn("No space left on device", output.getvalue())
@@ -0,0 +1,174 @@
+"""
+Smoke tests of the performance tools in system_tests/performance. Each tool runs briefly
+against its own emulator, in-process or launched under Lewis, so no IOC is needed.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from utils.test_modes import TestModes
+
+# the tools are run from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from system_tests.performance import benchmarks, session, soak, startup
+from system_tests.performance.emulator import free_port, launch_emulator, quiet
+from system_tests.performance.transport import IOC_POLL_REQUESTS, LineClient
+
+IOCS = []
+
+TEST_MODES = [TestModes.DEVSIM]
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# one pass of the IOC's polling requests from two clients
+BENCHMARK_TCP_ARGUMENTS = ("--no-in-process", "--cycles", "1", "--filter", "[2 clients]")
+
+# two cycles are too few to compare latencies, so only memory and containers are checked
+SOAK_ARGUMENTS = ("--cycles", "2", "--warmup", "1", "--samples", "2", "--max-latency-ratio", "100")
+
+
+def connect(address: tuple[str, int], timeout: float = 10.0) -> LineClient:
+    """
+    Connect to a server that is still starting up.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return LineClient(*address)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class SessionTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "session.jsonl")
+
+    def test_WHEN_session_recorded_through_proxy_THEN_replays_in_process_without_mismatches(
+        self,
+    ):
+        listen = ("127.0.0.1", free_port())
+        with launch_emulator() as upstream, quiet():
+            recorder = threading.Thread(
+                target=session.record, args=(listen, upstream, self.path), daemon=True
+            )
+            recorder.start()
+            client = connect(listen)
+            replies = [client.request(request) for request in IOC_POLL_REQUESTS]
+            client.close()
+            recorder.join(timeout=10)
+        self.assertFalse(recorder.is_alive())
+
+        exchanges = session.read_session(self.path)
+        self.assertEqual([exchange.request for exchange in exchanges], list(IOC_POLL_REQUESTS))
+        self.assertEqual([exchange.reply for exchange in exchanges], replies)
+
+        report = session.replay(exchanges)
+        self.assertEqual(report["exchanges"], len(IOC_POLL_REQUESTS))
+        self.assertEqual(report["missing_replies"], 0)
+        self.assertEqual(report["mismatches"], 0, report["mismatch_examples"])
+
+    def test_WHEN_session_replayed_against_emulator_THEN_report_compares_replies(self):
+        # replies were not kept, so every reply replayed differs from the recording
+        with open(self.path, "w") as session_file:
+            session.write_header(session_file, "test")
+            for index, request in enumerate(IOC_POLL_REQUESTS):
+                session.write_exchange(session_file, session.Exchange(index * 0.1, request, None))
+        report_path = os.path.join(os.path.dirname(self.path), "report.json")
+        arguments = ["replay", self.path, "--json", report_path, "--fail-on-mismatch"]
+
+        with launch_emulator() as (host, port), quiet():
+            exit_code = session.main([*arguments, "--address", f"{host}:{port}"])
+
+        self.assertEqual(exit_code, 1)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report["exchanges"], len(IOC_POLL_REQUESTS))
+        self.assertEqual(report["mismatches"], len(IOC_POLL_REQUESTS))
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_WHEN_in_process_cases_run_once_THEN_every_request_is_handled(self):
+        benchmarks.check_command_coverage()
+        with quiet():
+            for name, func in benchmarks.in_process_cases():
+                with self.subTest(name):
+                    result = func()
+                    if name.startswith("dispatch"):
+                        # the error path replies with nothing
+                        self.assertIsNotNone(result)
+
+    def test_WHEN_tcp_cases_run_THEN_results_written_without_timeouts(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, "results.json")
+        for protocol in ("stream", "stream_asyncio"):
+            # progress is written to stderr, which follows stdout to devnull
+            with self.subTest(protocol), quiet(), contextlib.redirect_stderr(sys.stdout):
+                exit_code = benchmarks.main(
+                    [*BENCHMARK_TCP_ARGUMENTS, "--protocol", protocol, "--output", output]
+                )
+                with open(output) as output_file:
+                    results = json.load(output_file)["results"]
+
+                self.assertEqual(exit_code, 0)
+                self.assertEqual(list(results), ["round_trip[2 clients]"])
+                self.assertEqual(results["round_trip[2 clients]"]["timeouts"], 0)
+
+    def test_WHEN_result_slower_than_baseline_by_more_than_tolerance_THEN_regression(self):
+        baseline = {"results": {"fast": {"value": 100.0}, "slow": {"value": 100.0}}}
+        results = {
+            "results": {
+                "fast": {"value": 120.0, "unit": "ns/op"},
+                "slow": {"value": 130.0, "unit": "ns/op"},
+                "new": {"value": 1000.0, "unit": "ns/op"},
+            }
+        }
+
+        regressions = benchmarks.compare(results, baseline, tolerance=0.25)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("slow:"))
+
+
+class SoakTests(unittest.TestCase):
+    def test_WHEN_soaked_briefly_THEN_report_written_without_failures(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, "report.json")
+        for target in ([], ["--launch"]):
+            with self.subTest(target), quiet(), contextlib.redirect_stderr(sys.stdout):
+                exit_code = soak.main([*SOAK_ARGUMENTS, *target, "--output", output])
+                with open(output) as output_file:
+                    report = json.load(output_file)
+
+                self.assertEqual(exit_code, 0, report["failures"])
+                self.assertEqual([sample["cycle"] for sample in report["samples"]], [1, 2])
+                self.assertEqual(report["stuck_cycles"], 0)
+
+
+class StartupTests(unittest.TestCase):
+    def test_WHEN_startup_measured_once_THEN_every_part_timed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, "startup.json")
+
+        # the parts measured in new interpreters import the emulator from the working directory
+        with contextlib.chdir(REPOSITORY_ROOT), quiet():
+            startup.main(["--repeat", "1", "--output", output])
+
+        with open(output) as output_file:
+            results = json.load(output_file)
+        self.assertEqual(list(results), ["import", "bind", "lewis", "launcher"])
+        for name, summary in results.items():
+            self.assertGreater(summary["max_ms"], 0, name)